@@ -0,0 +1,75 @@
+"""
+compares importing tiddlers one at a time with Store.put_tiddlers
+
+usage (from the repository root): python bench/bulk_import.py [count]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import mangler
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+
+from tiddlywebplugins.gitstore import Store
+
+
+def main(args):
+    count = int(args[1]) if len(args) > 1 else 1000
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        durations = []
+        for mode in ['tiddler_put', 'put_tiddlers']:
+            store = make_store(os.path.join(tmpdir, mode))
+            store.bag_put(Bag('alpha'))
+            tiddlers = make_tiddlers(count)
+
+            start = time.time()
+            if mode == 'tiddler_put':
+                for tiddler in tiddlers:
+                    store.tiddler_put(tiddler)
+            else:
+                store.put_tiddlers(tiddlers)
+            duration = time.time() - start
+
+            durations.append(duration)
+            print '%-12s %6d tiddlers: %8.3fs (%8.1f tiddlers/s)' % (mode,
+                    count, duration, count / duration)
+        print 'speedup: %.1fx' % (durations[0] / durations[1])
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def make_store(store_root):
+    config = {
+        'server_host': { 'scheme': 'http', 'host': 'example.com', 'port': 80 },
+        'server_store': ['tiddlywebplugins.gitstore', {
+            'store_root': store_root
+        }]
+    }
+    environ = {
+        'tiddlyweb.config': config,
+        'tiddlyweb.usersign': { 'name': 'JohnDoe' }
+    }
+    return Store(config['server_store'][1], environ)
+
+
+def make_tiddlers(count):
+    tiddlers = []
+    for i in xrange(count):
+        tiddler = Tiddler('Tiddler%s' % i, 'alpha')
+        tiddler.text = 'lorem ipsum dolor sit amet %s' % i
+        tiddler.tags = ['foo', 'bar']
+        tiddlers.append(tiddler)
+    return tiddlers
+
+
+if __name__ == '__main__':
+    status = main(sys.argv)
+    sys.exit(status)
@@ -0,0 +1,352 @@
+"""
+benchmarks for the store's hot paths, reporting per-operation timings as JSON
+
+usage (from the repository root): python bench/suite.py [options]
+
+see `python bench/suite.py --help` for the available scales; results are
+written to stdout unless `--output` is given, so that runs can be compared
+across releases
+"""
+
+import os
+import sys
+import json
+import random
+import shutil
+import platform
+import tempfile
+import subprocess
+
+from StringIO import StringIO
+from timeit import default_timer as timer
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import mangler
+
+import dulwich
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.recipe import Recipe
+from tiddlyweb.model.tiddler import Tiddler
+
+from tiddlywebplugins.gitstore.cache import (TIDDLERS, LISTINGS, TREES,
+        PARSED_TREES)
+from tiddlywebplugins.gitstore.stats import AGGREGATE
+
+
+BENCHMARKS = []
+
+
+def benchmark(fn):
+    BENCHMARKS.append(fn)
+    return fn
+
+
+def main(args):
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--store', default='tiddlywebplugins.gitstore',
+            help='store module (default: %(default)s)')
+    parser.add_argument('--tiddlers', type=int, default=1000,
+            help='number of tiddlers (default: %(default)s)')
+    parser.add_argument('--revisions', type=int, default=1000,
+            help='number of revisions of a single tiddler (default: '
+            '%(default)s)')
+    parser.add_argument('--binaries', type=int, default=100,
+            help='number of binary tiddlers (default: %(default)s)')
+    parser.add_argument('--binary-size', type=int, default=256 * 1024,
+            help='size of binary tiddlers in bytes (default: %(default)s)')
+    parser.add_argument('--recipes', type=int, default=1000,
+            help='number of recipes (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=10,
+            help='repetitions for listings (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+            help='random seed (default: %(default)s)')
+    parser.add_argument('--only', action='append', metavar='BENCHMARK',
+            choices=[fn.__name__ for fn in BENCHMARKS],
+            help='run only the given benchmark (repeatable)')
+    parser.add_argument('--output', help='file to write results to')
+    options = parser.parse_args(args[1:])
+
+    random.seed(options.seed)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        store = make_store(options.store, os.path.join(tmpdir, 'store'))
+        results = {}
+        for fn in BENCHMARKS:
+            if options.only and fn.__name__ not in options.only:
+                continue
+            print >> sys.stderr, 'running %s' % fn.__name__
+            durations = fn(store, options)
+            metrics = {}
+            if isinstance(durations, tuple): # including additional metrics
+                durations, metrics = durations
+            results[fn.__name__] = summarize(durations)
+            results[fn.__name__].update(metrics)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    report = {
+        'environment': environment(options.store),
+        'parameters': dict((key, value) for key, value
+                in vars(options).items() if key not in ('output', 'only')),
+        'results': results
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print output
+
+
+@benchmark
+def tiddler_put(store, options):
+    store.bag_put(Bag('alpha'))
+    durations = []
+    for i in xrange(options.tiddlers):
+        tiddler = make_tiddler('Tiddler%s' % i, 'alpha', i)
+        start = timer()
+        store.tiddler_put(tiddler)
+        durations.append(timer() - start)
+    return durations
+
+
+@benchmark
+def tiddler_get(store, options):
+    titles = ['Tiddler%s' % i for i in xrange(options.tiddlers)]
+    random.shuffle(titles)
+    durations = []
+    for title in titles:
+        clear_caches()
+        start = timer()
+        store.tiddler_get(Tiddler(title, 'alpha'))
+        durations.append(timer() - start)
+    return durations
+
+
+@benchmark
+def tiddler_get_cached(store, options):
+    titles = ['Tiddler%s' % i for i in xrange(options.tiddlers)]
+    random.shuffle(titles)
+    for title in titles: # warm up
+        store.tiddler_get(Tiddler(title, 'alpha'))
+    durations = []
+    for title in titles:
+        start = timer()
+        store.tiddler_get(Tiddler(title, 'alpha'))
+        durations.append(timer() - start)
+    return durations
+
+
+@benchmark
+def list_bag_tiddlers(store, options):
+    durations = []
+    for i in xrange(options.repeat):
+        clear_caches()
+        start = timer()
+        count = len(list(store.list_bag_tiddlers(Bag('alpha'))))
+        durations.append(timer() - start)
+    assert count == options.tiddlers
+    return durations
+
+
+@benchmark
+def list_tiddler_revisions(store, options):
+    store.bag_put(Bag('beta'))
+    for i in xrange(options.revisions):
+        store.tiddler_put(make_tiddler('Foo', 'beta', i))
+
+    durations = []
+    for i in xrange(options.repeat):
+        start = timer()
+        count = len(store.list_tiddler_revisions(Tiddler('Foo', 'beta')))
+        durations.append(timer() - start)
+    assert count == options.revisions
+    return durations
+
+
+@benchmark
+def get_tiddler_revision(store, options):
+    revisions = store.list_tiddler_revisions(Tiddler('Foo', 'beta'))
+    sample = random.sample(revisions, min(len(revisions), 100))
+    durations = []
+    for revision in sample:
+        clear_caches()
+        tiddler = Tiddler('Foo', 'beta')
+        tiddler.revision = revision
+        start = timer()
+        store.tiddler_get(tiddler)
+        durations.append(timer() - start)
+    return durations
+
+
+@benchmark
+def binary_put(store, options):
+    store.bag_put(Bag('gamma'))
+    durations = []
+    for i in xrange(options.binaries):
+        tiddler = Tiddler('Binary%s' % i, 'gamma')
+        tiddler.type = 'application/octet-stream'
+        tiddler.text = StringIO(os.urandom(options.binary_size))
+        start = timer()
+        store.tiddler_put(tiddler)
+        durations.append(timer() - start)
+    return durations
+
+
+@benchmark
+def list_recipes(store, options):
+    for i in xrange(options.recipes):
+        recipe = Recipe('Recipe%s' % i)
+        recipe.set_recipe([('alpha', ''), ('beta', '')])
+        store.recipe_put(recipe)
+
+    durations = []
+    for i in xrange(options.repeat):
+        start = timer()
+        count = len(list(store.list_recipes()))
+        durations.append(timer() - start)
+    assert count == options.recipes
+    return durations
+
+
+@benchmark
+def put_scaling(store, options):
+    """
+    puts into a bag ten times as large as another one, reporting the time spent
+    per put and on index maintenance per put for either bag, neither of which
+    should grow with the number of tiddlers
+
+    durations are those of the larger bag
+    """
+    put_times = {}
+    index_times = {}
+    for size in (options.tiddlers // 10, options.tiddlers):
+        bag_name = 'scaling%s' % size
+        fill_bag(store, bag_name, size)
+
+        durations = []
+        AGGREGATE.reset()
+        for i in xrange(options.repeat):
+            tiddler = make_tiddler('Extra%s' % i, bag_name, i)
+            start = timer()
+            store.tiddler_put(tiddler)
+            durations.append(timer() - start)
+        put_times[str(size)] = sum(durations) / len(durations)
+        index_times[str(size)] = AGGREGATE.snapshot().get('index',
+                { 'time': 0.0 })['time'] / options.repeat
+
+    return durations, { 'put_time': put_times,
+            'index_time_per_put': index_times }
+
+
+@benchmark
+def get_scaling(store, options):
+    """
+    gets distinct tiddlers from a bag ten times as large as another one,
+    reporting the time per get for either bag, which should not grow with the
+    number of tiddlers
+
+    durations are those of the larger bag
+    """
+    get_times = {}
+    for size in (options.tiddlers // 10, options.tiddlers):
+        bag_name = 'getscaling%s' % size
+        fill_bag(store, bag_name, size)
+        titles = ['Tiddler%s' % i for i in xrange(size)]
+        random.shuffle(titles)
+
+        clear_caches()
+        durations = []
+        for title in titles[:options.repeat * 20]:
+            start = timer()
+            store.tiddler_get(Tiddler(title, bag_name))
+            durations.append(timer() - start)
+        get_times[str(size)] = sum(durations) / len(durations)
+
+    return durations, { 'get_time': get_times }
+
+
+def summarize(durations):
+    """
+    returns statistics for the given durations (in seconds)
+    """
+    durations = sorted(durations)
+    count = len(durations)
+    total = sum(durations)
+    return {
+        'count': count,
+        'total': total,
+        'mean': total / count,
+        'median': durations[count // 2],
+        'p95': durations[min(count - 1, int(count * 0.95))],
+        'min': durations[0],
+        'max': durations[-1],
+        'ops_per_second': count / total if total else None
+    }
+
+
+def environment(store_module):
+    try:
+        revision = subprocess.check_output(['git', 'describe', '--always',
+                '--dirty'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'store': store_module,
+        'revision': revision,
+        'python': platform.python_version(),
+        'dulwich': '.'.join(str(part) for part in dulwich.__version__),
+        'platform': platform.platform()
+    }
+
+
+def clear_caches():
+    """
+    discard in-memory caches so that reads reflect cold performance
+    """
+    for cache in (TIDDLERS, LISTINGS, TREES, PARSED_TREES):
+        cache.clear()
+
+
+def make_store(module_name, store_root):
+    config = {
+        'server_host': { 'scheme': 'http', 'host': 'example.com', 'port': 80 },
+        'server_store': [module_name, {
+            'store_root': store_root
+        }]
+    }
+    environ = {
+        'tiddlyweb.config': config,
+        'tiddlyweb.usersign': { 'name': 'JohnDoe' }
+    }
+    module = __import__(module_name, fromlist=['Store'])
+    return module.Store(config['server_store'][1], environ)
+
+
+def fill_bag(store, bag_name, size):
+    """
+    creates a bag containing `size` tiddlers
+    """
+    store.bag_put(Bag(bag_name))
+    tiddlers = [make_tiddler('Tiddler%s' % i, bag_name, i)
+            for i in xrange(size)]
+    if hasattr(store, 'put_tiddlers'):
+        store.put_tiddlers(tiddlers)
+    else:
+        for tiddler in tiddlers:
+            store.tiddler_put(tiddler)
+
+
+def make_tiddler(title, bag_name, i):
+    tiddler = Tiddler(title, bag_name)
+    tiddler.text = 'lorem ipsum dolor sit amet %s' % i
+    tiddler.tags = ['foo', 'bar']
+    return tiddler
+
+
+if __name__ == '__main__':
+    status = main(sys.argv)
+    sys.exit(status)
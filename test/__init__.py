@@ -27,8 +27,9 @@ def initialize_app(cfg):
     return config
 
 
-def store_setup():
+def store_setup(store_module='tiddlywebplugins.gitstore', **store_config):
     tmpdir = tempfile.mkdtemp()
+    store_config['store_root'] = os.path.join(tmpdir, 'test_store')
 
     config = {
         'server_host': {
@@ -36,9 +37,7 @@ def store_setup():
             'host':'example.com',
             'port': 80
         },
-        'server_store': ['tiddlywebplugins.gitstore', {
-            'store_root': os.path.join(tmpdir, 'test_store')
-        }]
+        'server_store': [store_module, store_config]
     }
     environ = {
         'tiddlyweb.config': config,
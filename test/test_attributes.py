@@ -0,0 +1,95 @@
+# coding=UTF-8
+
+from tiddlyweb.filters import FilterIndexRefused
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+
+from tiddlywebplugins.gitstore.indexer import index_query
+
+from pytest import raises
+
+from . import store_setup, store_teardown
+
+
+def setup_module(module):
+    module.STORE, module.TMPDIR = store_setup()
+    module.ENVIRON = { 'tiddlyweb.store': module.STORE }
+
+    for bag_name in ['alpha', 'bravo']:
+        module.STORE.put(Bag(bag_name))
+
+    for title, bag_name, tags, fields in [
+            ('Foo', 'alpha', ['hello'], { 'status': 'draft' }),
+            ('Bar', 'alpha', ['hello', 'world'], { 'status': 'final' }),
+            ('Baz', 'bravo', ['hello'], { 'tag': 'world' }),
+            (u'Ünïcode Title', 'bravo', [u'ümlaut'], { 'status': u'fïnal' })]:
+        tiddler = Tiddler(title, bag_name)
+        tiddler.text = 'lorem ipsum'
+        tiddler.tags = tags
+        tiddler.fields = fields
+        tiddler.modifier = 'JohnDoe'
+        module.STORE.put(tiddler)
+
+
+def teardown_module(module):
+    store_teardown(module.TMPDIR)
+
+
+def _select(bag_name, attribute, value):
+    return [tiddler.title for tiddler
+            in STORE.storage.select_tiddlers(bag_name, attribute, value)]
+
+
+def test_select():
+    assert _select('alpha', 'tag', 'hello') == ['Bar', 'Foo']
+    assert _select('bravo', 'tag', 'hello') == ['Baz']
+    assert _select('alpha', 'tag', 'world') == ['Bar']
+    assert _select('bravo', 'tag', 'world') == [] # field named "tag"
+    assert _select('bravo', 'tag', u'ümlaut') == [u'Ünïcode Title']
+    assert _select('alpha', 'field', 'status') == ['Bar', 'Foo']
+    assert _select('alpha', 'status', 'draft') == ['Foo']
+    assert _select('bravo', 'status', u'fïnal') == [u'Ünïcode Title']
+    assert _select('alpha', 'modifier', 'JohnDoe') == ['Bar', 'Foo']
+
+    with raises(ValueError):
+        _select('alpha', 'text', 'lorem')
+
+
+def test_incremental_update():
+    tiddler = Tiddler('Foo', 'alpha')
+    tiddler.tags = ['world']
+    tiddler.fields = { 'status': 'final' }
+    STORE.put(tiddler)
+    STORE.delete(Tiddler('Bar', 'alpha'))
+
+    assert _select('alpha', 'tag', 'hello') == []
+    assert _select('alpha', 'tag', 'world') == ['Foo']
+    assert _select('alpha', 'status', 'draft') == []
+    assert _select('alpha', 'status', 'final') == ['Foo']
+
+
+def test_index_query():
+    tiddlers = index_query(ENVIRON, bag='bravo', tag='hello')
+    assert [tiddler.title for tiddler in tiddlers] == ['Baz']
+    assert tiddlers[0].text == 'lorem ipsum'
+
+    tiddlers = index_query(ENVIRON, bag='alpha', title='Foo')
+    assert [tiddler.title for tiddler in tiddlers] == ['Foo']
+    assert index_query(ENVIRON, bag='alpha', title='Bar') == []
+
+    tiddlers = index_query(ENVIRON, id='bravo:Baz')
+    assert [(tiddler.bag, tiddler.title) for tiddler in tiddlers] == \
+            [('bravo', 'Baz')]
+    assert index_query(ENVIRON, id='alpha:Baz') == []
+
+    with raises(FilterIndexRefused):
+        index_query(ENVIRON, bag='alpha', text='lorem')
+
+    with STORE.storage.snapshot():
+        assert len(index_query(ENVIRON, bag='alpha', tag='world')) == 1
+
+        tiddler = Tiddler('Qux', 'alpha')
+        tiddler.tags = ['world']
+        STORE.put(tiddler)
+        with raises(FilterIndexRefused): # index ahead of pinned snapshot
+            index_query(ENVIRON, bag='alpha', tag='world')
@@ -0,0 +1,177 @@
+# coding=UTF-8
+
+import os
+
+from StringIO import StringIO
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.recipe import Recipe
+from tiddlyweb.model.tiddler import Tiddler
+from tiddlyweb.model.user import User
+from tiddlyweb.store import NoBagError, NoTiddlerError, NoUserError
+
+from tiddlywebplugins.gitstore import run
+
+from pytest import raises
+
+from . import store_setup, store_teardown
+
+
+def setup_module(module):
+    module.STORE, module.TMPDIR = store_setup('tiddlywebplugins.gitstore.bare')
+    module.STORE_ROOT = os.path.join(TMPDIR, 'test_store')
+
+
+def teardown_module(module):
+    store_teardown(TMPDIR)
+
+
+def test_initialization():
+    assert STORE.storage.repo.bare
+    assert list(STORE.list_bags()) == []
+    assert not os.path.exists(os.path.join(STORE_ROOT, 'bags'))
+
+
+def test_bag():
+    bag = Bag(u'ählpha')
+    bag.desc = u'lörem ipsum'
+    bag.policy.read = ['JohnDoe']
+    STORE.put(bag)
+
+    assert [bag.name for bag in STORE.list_bags()] == [u'ählpha']
+    stored_bag = STORE.get(Bag(u'ählpha'))
+    assert stored_bag.desc == u'lörem ipsum'
+    assert stored_bag.policy.read == ['JohnDoe']
+
+    with raises(NoBagError):
+        STORE.get(Bag('missing'))
+
+
+def test_tiddler():
+    STORE.put(Bag('alpha'))
+    revisions = []
+    for text in ['lorem ipsum', 'lorem ipsum\ndolor sit amet']:
+        tiddler = Tiddler('Foo', 'alpha')
+        tiddler.text = text
+        tiddler.tags = [u'föö']
+        STORE.put(tiddler)
+        revisions.append(tiddler.revision)
+
+    tiddler = STORE.get(Tiddler('Foo', 'alpha'))
+    assert tiddler.text == 'lorem ipsum\ndolor sit amet'
+    assert tiddler.tags == [u'föö']
+    assert tiddler.revision == revisions[-1]
+    assert STORE.list_tiddler_revisions(tiddler) == revisions[::-1]
+
+    tiddler = Tiddler('Foo', 'alpha')
+    tiddler.revision = revisions[0]
+    assert STORE.get(tiddler).text == 'lorem ipsum'
+
+    assert [tiddler.title for tiddler
+            in STORE.list_bag_tiddlers(Bag('alpha'))] == ['Foo']
+    assert [tiddler.title for tiddler in STORE.search('dolor')] == ['Foo']
+
+    with raises(NoTiddlerError):
+        STORE.get(Tiddler('Bar', 'alpha'))
+    with raises(NoBagError):
+        STORE.put(Tiddler('Bar', 'missing'))
+
+    STORE.delete(Tiddler('Foo', 'alpha'))
+    with raises(NoTiddlerError):
+        STORE.get(Tiddler('Foo', 'alpha'))
+    assert list(STORE.list_bag_tiddlers(Bag('alpha'))) == []
+
+
+def test_binary_tiddler():
+    for data in ['\x89PNG\x00\xff', StringIO('\x89PNG\x00\xff')]:
+        tiddler = Tiddler('image', 'alpha')
+        tiddler.type = 'image/png'
+        tiddler.text = data
+        STORE.put(tiddler)
+        revision = tiddler.revision
+
+    tiddler = STORE.get(Tiddler('image', 'alpha'))
+    assert tiddler.text == '\x89PNG\x00\xff'
+    assert tiddler.revision == revision
+    assert STORE.storage.verify_binary(tiddler)
+    assert len(STORE.list_tiddler_revisions(tiddler)) == 1 # identical re-upload
+
+    STORE.delete(Tiddler('image', 'alpha'))
+    tree = run('git', 'ls-tree', '-r', '--name-only', 'HEAD', 'bags/alpha',
+            cwd=STORE_ROOT)
+    assert 'image' not in tree
+
+
+def test_bulk():
+    tiddlers = []
+    for title in ['Foo', 'Bar', 'Baz']:
+        tiddler = Tiddler(title, 'alpha')
+        tiddler.text = 'lorem ipsum'
+        tiddlers.append(tiddler)
+    STORE.storage.put_tiddlers(tiddlers)
+
+    assert len(set(tiddler.revision for tiddler in tiddlers)) == 1
+    assert sorted(tiddler.title for tiddler
+            in STORE.list_bag_tiddlers(Bag('alpha'))) == ['Bar', 'Baz', 'Foo']
+
+    STORE.delete(Bag('alpha'))
+    with raises(NoBagError):
+        STORE.get(Bag('alpha'))
+    with raises(NoBagError):
+        list(STORE.list_bag_tiddlers(Bag('alpha')))
+
+
+def test_bag_delete_indexes():
+    STORE.put(Bag('beta'))
+    tiddler = Tiddler('Foo', 'beta')
+    tiddler.text = 'hello world'
+    tiddler.tags = ['x']
+    STORE.put(tiddler)
+
+    STORE.delete(Bag('beta'))
+    assert list(STORE.search('hello')) == []
+    assert list(STORE.storage.recent_tiddlers('beta')) == []
+    assert list(STORE.storage.select_tiddlers('beta', 'tag', 'x')) == []
+
+    # the deletion is recorded in the tiddler's history, as with a working tree
+    deletion = STORE.storage.repo.head()[:10]
+    STORE.put(Bag('beta'))
+    tiddler = Tiddler('Foo', 'beta')
+    tiddler.text = 'lorem ipsum'
+    STORE.put(tiddler)
+    revisions = STORE.list_tiddler_revisions(tiddler)
+    assert revisions[:2] == [tiddler.revision, deletion]
+    assert len(revisions) == 3
+
+
+def test_recipe_and_user():
+    recipe = Recipe('omega')
+    recipe.set_recipe([(u'ählpha', '')])
+    STORE.put(recipe)
+    assert STORE.get(Recipe('omega')).get_recipe() == [[u'ählpha', '']]
+    assert [recipe.name for recipe in STORE.list_recipes()] == ['omega']
+
+    user = User('JohnDoe')
+    user.set_password('secret')
+    user.add_role('ADMIN')
+    STORE.put(user)
+    stored_user = STORE.get(User('JohnDoe'))
+    assert stored_user.check_password('secret')
+    assert stored_user.list_roles() == ['ADMIN']
+    assert [user.usersign for user in STORE.list_users()] == ['JohnDoe']
+
+    STORE.delete(User('JohnDoe'))
+    with raises(NoUserError):
+        STORE.get(User('JohnDoe'))
+
+
+def test_no_working_tree():
+    entries = os.listdir(STORE_ROOT)
+    assert 'objects' in entries
+    for dirname in ['bags', 'recipes', 'users']:
+        assert dirname not in entries
+
+
+def test_async_durability():
+    with raises(ValueError):
+        store_setup('tiddlywebplugins.gitstore.bare', durability='async')
@@ -1,12 +1,16 @@
 import os
 import hashlib
 
+from StringIO import StringIO
+from base64 import b64decode
+
 from tiddlyweb.model.bag import Bag
 from tiddlyweb.model.tiddler import Tiddler
 from tiddlyweb.serializer import TiddlerFormatError
 from tiddlyweb.util import sha
 
 from tiddlywebplugins.gitstore import run
+from tiddlywebplugins.gitstore.streams import FileStream, CHUNK_SIZE
 
 from pytest import raises
 
@@ -51,7 +55,8 @@ def test_file_separation():
         lines = contents.splitlines()
         assert ': ' in lines[-3] # header
         assert lines[-2] == '' # separator
-        assert len(lines[-1]) == 60 # body
+        assert b64decode(lines[-1]) == ('~.~.~bincue~.~.~ sha1:%s' %
+                hashlib.sha1('lorem ipsum').hexdigest()) # body
     with open(bin_file) as fh:
         contents = fh.read()
         assert contents == 'lorem ipsum'
@@ -201,3 +206,79 @@ def test_title_conflicts():
 
 def file_checksum(filename):
     return sha(open(filename).read()).hexdigest()
+
+
+def test_streaming():
+    store, tmpdir = store_setup(binary_stream_threshold=1024)
+    store_root = os.path.join(tmpdir, 'test_store')
+    try:
+        store.put(Bag('alpha'))
+
+        data = ''.join(chr(i % 256) for i in xrange(CHUNK_SIZE * 3 + 7))
+        tiddler = Tiddler('Foo', 'alpha')
+        tiddler.type = 'application/octet-stream'
+        tiddler.text = StringIO(data)
+        store.put(tiddler)
+
+        stored_tiddler = store.get(Tiddler('Foo', 'alpha'))
+        assert isinstance(stored_tiddler.text, FileStream)
+        chunks = list(stored_tiddler.text)
+        stored_tiddler.text.close()
+        assert len(chunks) == 4
+        assert ''.join(chunks) == data
+
+        blob = run('git', 'show', 'HEAD:bags/alpha/tiddlers/_binaries/Foo',
+                cwd=store_root)
+        assert blob == data
+        assert run('git', 'status', '--porcelain', cwd=store_root) == ''
+
+        # contents not matching the commit are never served
+        binary_file = os.path.join(store_root, 'bags', 'alpha', 'tiddlers',
+                '_binaries', 'Foo')
+        with open(binary_file, 'r+b') as fh:
+            fh.seek(CHUNK_SIZE * 2)
+            fh.write('...')
+        stored_tiddler = store.get(Tiddler('Foo', 'alpha'))
+        assert stored_tiddler.text == data
+        run('git', 'checkout', '--', binary_file, cwd=store_root)
+
+        tiddler = Tiddler('Bar', 'alpha')
+        tiddler.type = 'application/octet-stream'
+        tiddler.text = 'lorem ipsum' # below threshold
+        store.put(tiddler)
+        assert store.get(Tiddler('Bar', 'alpha')).text == 'lorem ipsum'
+    finally:
+        store_teardown(tmpdir)
+
+
+def test_identical_reupload():
+    tiddler = Tiddler('Lipsum', BAG.name)
+    tiddler.type = 'application/binary'
+    tiddler.text = 'lorem ipsum'
+    STORE.put(tiddler)
+    revision = tiddler.revision
+
+    head = run('git', 'rev-parse', 'HEAD', cwd=STORE_ROOT)
+    tiddler = Tiddler('Lipsum', BAG.name)
+    tiddler.type = 'application/binary'
+    tiddler.text = 'lorem ipsum'
+    STORE.put(tiddler)
+    assert tiddler.revision == revision
+    assert tiddler.text == 'lorem ipsum'
+    assert run('git', 'rev-parse', 'HEAD', cwd=STORE_ROOT) == head
+
+    assert STORE.storage.binary_digest(tiddler) == \
+            hashlib.sha1('lorem ipsum').hexdigest()
+    assert STORE.storage.verify_binary(tiddler)
+
+    tiddler.text = 'lorem ipsum dolor sit amet'
+    STORE.put(tiddler)
+    assert tiddler.revision != revision
+    assert STORE.storage.binary_digest(tiddler) == \
+            hashlib.sha1('lorem ipsum dolor sit amet').hexdigest()
+
+    binary_file = os.path.join(STORE_ROOT, 'bags', 'alpha', 'tiddlers',
+            '_binaries', 'Lipsum')
+    with open(binary_file, 'a') as fh:
+        fh.write('...')
+    assert not STORE.storage.verify_binary(tiddler)
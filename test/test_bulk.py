@@ -0,0 +1,62 @@
+import os
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+from tiddlyweb.store import NoBagError
+
+from tiddlywebplugins.gitstore import run
+
+from pytest import raises
+
+from . import store_setup, store_teardown
+
+
+def setup_module(module):
+    module.STORE, module.TMPDIR = store_setup()
+    module.STORE_ROOT = os.path.join(module.TMPDIR, 'test_store')
+    module.STORE.put(Bag('alpha'))
+
+
+def teardown_module(module):
+    store_teardown(module.TMPDIR)
+
+
+def test_put_tiddlers():
+    commits_before = len(run('git', 'log', '--format=%H',
+            cwd=STORE_ROOT).splitlines())
+
+    tiddlers = []
+    for i in range(20):
+        tiddler = Tiddler('Foo%s' % i, 'alpha')
+        tiddler.text = 'lorem ipsum %s' % i
+        tiddler.tags = ['foo']
+        tiddlers.append(tiddler)
+    tiddler = Tiddler('Bar', 'alpha')
+    tiddler.type = 'application/binary'
+    tiddler.text = 'lorem ipsum'
+    tiddlers.append(tiddler)
+
+    tiddlers = STORE.storage.put_tiddlers(iter(tiddlers))
+
+    commits = run('git', 'log', '--format=%h', '--abbrev=10',
+            cwd=STORE_ROOT).splitlines()
+    assert len(commits) == commits_before + 1
+    assert run('git', 'status', '--porcelain', cwd=STORE_ROOT) == ''
+    info = run('git', 'log', '-n1', '--format=%s', cwd=STORE_ROOT)
+    assert info.strip() == 'tiddlers put: 21 tiddlers in alpha'
+
+    for tiddler in tiddlers:
+        assert tiddler.revision == commits[0]
+        stored_tiddler = STORE.get(Tiddler(tiddler.title, 'alpha'))
+        assert stored_tiddler.text == tiddler.text
+        assert stored_tiddler.revision == commits[0]
+
+    assert len(list(STORE.list_bag_tiddlers(Bag('alpha')))) == 21
+    assert STORE.storage.put_tiddlers([]) == []
+
+
+def test_put_tiddlers_missing_bag():
+    tiddlers = [Tiddler('Foo', 'alpha'), Tiddler('Foo', 'bravo')]
+    with raises(NoBagError):
+        STORE.storage.put_tiddlers(tiddlers)
+    assert run('git', 'status', '--porcelain', cwd=STORE_ROOT) == ''
@@ -0,0 +1,58 @@
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+
+from tiddlywebplugins.gitstore.cache import TIDDLERS
+
+from . import store_setup, store_teardown
+
+
+def setup_module(module):
+    module.STORE, module.TMPDIR = store_setup()
+    module.STORE.put(Bag('alpha'))
+
+
+def teardown_module(module):
+    store_teardown(module.TMPDIR)
+
+
+def test_parsed_tiddlers():
+    serializer = STORE.storage.serializer
+    parses = []
+    from_string = serializer.from_string
+    def counting_from_string(string):
+        parses.append(string)
+        return from_string(string)
+    serializer.from_string = counting_from_string
+
+    try:
+        tiddler = Tiddler('Foo', 'alpha')
+        tiddler.text = 'lorem ipsum'
+        tiddler.modifier = 'JohnDoe'
+        STORE.put(tiddler)
+        TIDDLERS.clear()
+
+        tiddler = STORE.get(Tiddler('Foo', 'alpha'))
+        assert tiddler.text == 'lorem ipsum'
+        assert len(parses) == 1
+
+        tiddler.text = 'dolor sit amet'
+        tiddler.modifier = 'JaneDoe'
+        STORE.put(tiddler) # creator lookup
+        assert len(parses) == 1
+        assert tiddler.creator == 'JohnDoe'
+
+        for i in range(3):
+            tiddler = STORE.get(Tiddler('Foo', 'alpha'))
+            assert tiddler.text == 'dolor sit amet'
+            assert tiddler.creator == 'JohnDoe'
+        assert len(parses) == 2 # newly written revision
+
+        tiddler.text = 'consectetur'
+        STORE.put(tiddler)
+        assert len(parses) == 2
+        # cached entries are not affected by modifications
+        tiddler = Tiddler('Foo', 'alpha')
+        tiddler.revision = STORE.list_tiddler_revisions(tiddler)[1]
+        assert STORE.get(tiddler).text == 'dolor sit amet'
+    finally:
+        del serializer.from_string
@@ -0,0 +1,108 @@
+from __future__ import absolute_import
+
+import httplib2
+import simplejson
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+from tiddlyweb.store import NoBagError
+
+from tiddlywebplugins.gitstore import stats
+
+from pytest import raises
+
+from . import initialize_app, store_setup, store_teardown
+
+
+def setup_module(module):
+    module.STORE, module.TMPDIR = store_setup()
+    config = dict(module.STORE.environ['tiddlyweb.config'])
+    config['system_plugins'] = ['tiddlywebplugins.gitstore.web']
+    initialize_app(config)
+
+
+def teardown_module(module):
+    store_teardown(module.TMPDIR)
+
+
+def test_changes():
+    storage = STORE.storage
+    STORE.put(Bag('alpha'))
+    STORE.put(Bag('beta'))
+    for title in ['Foo', 'Bar']:
+        tiddler = Tiddler(title, 'alpha')
+        tiddler.text = 'lorem ipsum'
+        STORE.put(tiddler)
+
+    changes = storage.tiddler_changes('alpha')
+    assert sorted(changes['added']) == ['Bar', 'Foo']
+    assert changes['modified'] == changes['deleted'] == []
+    head = changes['head']
+
+    assert storage.tiddler_changes('alpha', head)['added'] == []
+
+    tiddler = Tiddler('Foo', 'alpha')
+    tiddler.text = 'dolor sit amet'
+    STORE.put(tiddler)
+    STORE.delete(Tiddler('Bar', 'alpha'))
+    tiddler = Tiddler('Baz', 'alpha')
+    tiddler.type = 'image/png'
+    tiddler.text = '\x89PNG'
+    STORE.put(tiddler)
+    tiddler = Tiddler('Qux', 'beta') # unrelated bag
+    tiddler.text = 'lorem ipsum'
+    STORE.put(tiddler)
+
+    changes = storage.tiddler_changes('alpha', head)
+    assert changes['added'] == ['Baz']
+    assert changes['modified'] == ['Foo']
+    assert changes['deleted'] == ['Bar']
+    assert changes['head'] != head
+
+    with raises(ValueError):
+        storage.tiddler_changes('alpha', 'deadbeef')
+    with raises(NoBagError):
+        storage.tiddler_changes('gamma')
+
+
+def test_concurrent_commit(monkeypatch):
+    storage = STORE.storage
+    head = storage.tiddler_changes('alpha')['head']
+    tiddler = Tiddler('Foo', 'alpha')
+    tiddler.text = 'lorem ipsum\ndolor sit amet'
+    STORE.put(tiddler)
+
+    # simulate a commit happening while changes are being determined
+    commits = [head, storage._head()]
+    monkeypatch.setattr(storage, '_snapshot', lambda: commits.pop(0))
+    changes = storage.tiddler_changes('alpha', head)
+    monkeypatch.undo()
+    # changes are reported relative to the returned head, so none are missed
+    assert changes['head'] == head
+    assert changes['modified'] == []
+
+
+def test_http():
+    http = httplib2.Http()
+    response, content = http.request('http://example.org:8001/bags/alpha/changes')
+    assert response.status == 200
+    assert response['content-type'] == 'application/json; charset=UTF-8'
+    changes = simplejson.loads(content)
+    assert sorted(changes['added']) == ['Baz', 'Foo']
+
+    response, content = http.request(
+            'http://example.org:8001/bags/alpha/changes?since=%s' %
+            changes['head'])
+    assert response.status == 200
+    assert simplejson.loads(content)['added'] == []
+
+    response, content = http.request(
+            'http://example.org:8001/bags/alpha/changes?since=foo')
+    assert response.status == 400
+
+    response, content = http.request(
+            'http://example.org:8001/bags/gamma/changes')
+    assert response.status == 404
+
+    # timings are no longer collected for the request once it has been handled
+    assert stats._CURRENT.timings is None
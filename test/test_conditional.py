@@ -0,0 +1,106 @@
+from __future__ import absolute_import
+
+import httplib2
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+from tiddlyweb.store import NoTiddlerError
+
+from tiddlywebplugins.gitstore import Store
+
+from pytest import raises
+
+from . import initialize_app, store_setup, store_teardown
+
+
+URI = 'http://example.org:8001/bags/alpha/tiddlers/Foo'
+
+
+def setup_module(module):
+    module.STORE, module.TMPDIR = store_setup()
+    config = dict(module.STORE.environ['tiddlyweb.config'])
+    config['system_plugins'] = ['tiddlywebplugins.gitstore.web']
+    initialize_app(config)
+
+    module.STORE.put(Bag('alpha'))
+    tiddler = Tiddler('Foo', 'alpha')
+    tiddler.text = 'lorem ipsum'
+    module.STORE.put(tiddler)
+
+
+def teardown_module(module):
+    store_teardown(module.TMPDIR)
+
+
+def test_tiddler_version():
+    storage = STORE.storage
+    tiddler = STORE.get(Tiddler('Foo', 'alpha'))
+    revision, blob_id = storage.tiddler_version(Tiddler('Foo', 'alpha'))
+    assert revision == tiddler.revision
+    assert len(blob_id) == 40
+
+    with raises(NoTiddlerError):
+        storage.tiddler_version(Tiddler('Bar', 'alpha'))
+
+    assert len(storage.policy_version('alpha')) == 40
+
+
+def test_conditional_get():
+    http = httplib2.Http()
+    response, content = http.request(URI, headers={ 'Accept': 'text/plain' })
+    assert response.status == 200
+    etag = response['etag']
+
+    reads = []
+    tiddler_get = Store.tiddler_get
+    def counting_tiddler_get(self, tiddler):
+        reads.append(tiddler.title)
+        return tiddler_get(self, tiddler)
+    Store.tiddler_get = counting_tiddler_get
+    try:
+        response, content = http.request(URI, headers={
+            'Accept': 'text/plain',
+            'If-None-Match': etag
+        })
+        assert response.status == 304
+        assert response['etag'] == etag
+        assert reads == []
+
+        # different representation
+        response, content = http.request(URI, headers={
+            'Accept': 'application/json',
+            'If-None-Match': etag
+        })
+        assert response.status == 200
+        assert reads == ['Foo']
+
+        tiddler = Tiddler('Foo', 'alpha')
+        tiddler.text = 'dolor sit amet'
+        STORE.put(tiddler)
+
+        response, content = http.request(URI, headers={
+            'Accept': 'text/plain',
+            'If-None-Match': etag
+        })
+        assert response.status == 200
+        assert response['etag'] != etag
+        assert content.endswith('dolor sit amet\n')
+        etag = response['etag']
+
+        response, content = http.request(URI, headers={
+            'Accept': 'text/plain',
+            'If-None-Match': etag
+        })
+        assert response.status == 304
+        assert reads == ['Foo', 'Foo']
+
+        bag = Bag('alpha')
+        bag.policy.read = ['JohnDoe']
+        STORE.put(bag)
+        response, content = http.request(URI, headers={
+            'Accept': 'text/plain',
+            'If-None-Match': etag
+        })
+        assert response.status == 401
+    finally:
+        Store.tiddler_get = tiddler_get
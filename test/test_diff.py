@@ -0,0 +1,68 @@
+# coding=UTF-8
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+from tiddlyweb.store import NoTiddlerError
+
+from pytest import raises
+
+from . import store_setup, store_teardown
+
+
+def setup_module(module):
+    module.STORE, module.TMPDIR = store_setup()
+
+
+def teardown_module(module):
+    store_teardown(module.TMPDIR)
+
+
+def test_diff():
+    STORE.put(Bag('alpha'))
+    revisions = []
+    for text, tags, fields in [
+            ('lorem ipsum\ndolor sit amet', ['foo', 'bar'], { 'a': '1', 'b': '2' }),
+            ('lorem ipsum\nconsectetur', ['bar', 'baz'], { 'a': '1', 'b': '3', 'c': '4' })]:
+        tiddler = Tiddler('Foo', 'alpha')
+        tiddler.text = text
+        tiddler.tags = tags
+        tiddler.fields = fields
+        STORE.put(tiddler)
+        revisions.append(tiddler.revision)
+
+    diff = STORE.storage.tiddler_diff(Tiddler('Foo', 'alpha'), revisions[0])
+    assert diff['revisions'] == revisions
+    assert diff['tags'] == { 'added': ['baz'], 'removed': ['foo'] }
+    assert diff['fields'] == { 'added': { 'c': '4' }, 'removed': {},
+            'changed': { 'b': ['2', '3'] } }
+    assert diff['text'].splitlines()[2:] == ['@@ -1,2 +1,2 @@', ' lorem ipsum',
+            '-dolor sit amet', '+consectetur']
+    assert diff['text_changed']
+    assert diff['binary'] is False
+
+    # cached results are not affected by modifications
+    diff['tags']['added'].append('qux')
+    diff = STORE.storage.tiddler_diff(Tiddler('Foo', 'alpha'), revisions[0],
+            revisions[1])
+    assert diff['tags']['added'] == ['baz']
+
+    diff = STORE.storage.tiddler_diff(Tiddler('Foo', 'alpha'), revisions[1])
+    assert diff['text'] is None
+    assert diff['attributes'] == {}
+
+    with raises(NoTiddlerError):
+        STORE.storage.tiddler_diff(Tiddler('Foo', 'alpha'), 'deadbeef')
+
+
+def test_unicode_title():
+    revisions = []
+    for text in [u'lörem ipsum', u'dolor sit ämet']:
+        tiddler = Tiddler(u'Ünï/code', 'alpha')
+        tiddler.text = text
+        STORE.put(tiddler)
+        revisions.append(tiddler.revision)
+
+    diff = STORE.storage.tiddler_diff(Tiddler(u'Ünï/code', 'alpha'),
+            revisions[0])
+    assert diff['text'].splitlines() == [u'--- a/Ünï/code', u'+++ b/Ünï/code',
+            '@@ -1 +1 @@', u'-lörem ipsum', u'+dolor sit ämet']
@@ -0,0 +1,91 @@
+import os
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+
+from tiddlywebplugins.gitstore import run
+from tiddlywebplugins.gitstore.locks import LockTimeout
+
+from pytest import raises
+
+from . import store_setup, store_teardown
+
+
+def test_async():
+    for mode in ['async', 'async-fsync']:
+        store, tmpdir = store_setup(durability=mode)
+        store_root = os.path.join(tmpdir, 'test_store')
+        journal = os.path.join(store_root, '.git', 'tiddlyweb', 'journal')
+        try:
+            writer = store.storage._repository.writer
+            store.put(Bag('alpha'))
+
+            for text in ['lorem ipsum', 'lorem ipsum\ndolor sit amet']:
+                tiddler = Tiddler('Foo', 'alpha')
+                tiddler.text = text
+                store.put(tiddler)
+                assert tiddler.revision is None # not committed yet
+
+            writer.flush()
+            assert not os.path.exists(journal)
+            assert run('git', 'status', '--porcelain', cwd=store_root) == ''
+            info = run('git', 'show', 'HEAD:bags/alpha/tiddlers/Foo',
+                    cwd=store_root)
+            assert info.endswith('lorem ipsum\ndolor sit amet\n')
+
+            tiddler = store.get(Tiddler('Foo', 'alpha'))
+            assert tiddler.text == 'lorem ipsum\ndolor sit amet'
+            assert tiddler.revision
+        finally:
+            store_teardown(tmpdir)
+
+
+def test_async_listing():
+    store, tmpdir = store_setup(durability='async')
+    try:
+        store.put(Bag('alpha'))
+        tiddler = Tiddler('Foo', 'alpha')
+        tiddler.text = 'lorem ipsum'
+        store.put(tiddler)
+
+        tiddlers = list(store.list_bag_tiddlers(Bag('alpha')))
+        assert [tiddler.title for tiddler in tiddlers] == ['Foo']
+    finally:
+        store_teardown(tmpdir)
+
+
+def test_invalid_mode():
+    with raises(ValueError):
+        store_setup(durability='eventually')
+
+
+def test_async_retry():
+    store, tmpdir = store_setup(durability='async')
+    store_root = os.path.join(tmpdir, 'test_store')
+    journal = os.path.join(store_root, '.git', 'tiddlyweb', 'journal')
+    try:
+        writer = store.storage._repository.writer
+        store.put(Bag('alpha'))
+        writer.flush()
+
+        commit = writer._commit
+        failures = []
+        def failing_commit(entries):
+            if not failures:
+                failures.append(entries)
+                raise LockTimeout('commit lock')
+            return commit(entries)
+        writer._commit = failing_commit
+
+        tiddler = Tiddler('Foo', 'alpha')
+        tiddler.text = 'lorem ipsum'
+        store.put(tiddler)
+        assert writer.flush(5)
+        assert len(failures) == 1
+        assert not os.path.exists(journal)
+        assert run('git', 'status', '--porcelain', cwd=store_root) == ''
+        info = run('git', 'show', 'HEAD:bags/alpha/tiddlers/Foo',
+                cwd=store_root)
+        assert info.endswith('lorem ipsum\n')
+    finally:
+        store_teardown(tmpdir)
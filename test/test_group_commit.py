@@ -0,0 +1,68 @@
+import os
+
+from threading import Thread
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+from tiddlyweb.store import Store
+
+from tiddlywebplugins.gitstore import run
+
+from . import store_setup, store_teardown
+
+
+def setup_module(module):
+    module.STORE, module.TMPDIR = store_setup(group_commit={
+        'window': 0.2,
+        'max_files': 5
+    })
+    module.STORE_ROOT = os.path.join(module.TMPDIR, 'test_store')
+    module.STORE.put(Bag('alpha'))
+
+
+def teardown_module(module):
+    store_teardown(module.TMPDIR)
+
+
+def test_concurrent_writes():
+    tiddlers = [Tiddler('Foo%s' % i, 'alpha') for i in range(5)]
+
+    def put(tiddler):
+        environ = STORE.environ
+        config = environ['tiddlyweb.config']
+        store = Store(config['server_store'][0], config['server_store'][1],
+                environ)
+        tiddler.text = 'lorem ipsum'
+        store.put(tiddler)
+
+    commits_before = len(run('git', 'log', '--format=%H',
+            cwd=STORE_ROOT).splitlines())
+
+    threads = [Thread(target=put, args=(tiddler,)) for tiddler in tiddlers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    commits = run('git', 'log', '--format=%H', cwd=STORE_ROOT).splitlines()
+    assert len(commits) - commits_before < len(tiddlers)
+    assert run('git', 'status', '--porcelain', cwd=STORE_ROOT) == ''
+
+    for tiddler in tiddlers:
+        assert tiddler.revision
+        revisions = STORE.list_tiddler_revisions(Tiddler(tiddler.title, 'alpha'))
+        assert revisions == [tiddler.revision]
+
+    message = run('git', 'log', '-n1', '--format=%B', cwd=STORE_ROOT)
+    assert message.startswith('group commit: ')
+
+
+def test_single_write():
+    tiddler = Tiddler('Bar', 'alpha')
+    tiddler.text = 'lorem ipsum'
+    STORE.put(tiddler)
+
+    info = run('git', 'log', '-n1', '--format=%ae: %s', cwd=STORE_ROOT)
+    assert info.strip() == 'JohnDoe@example.com: tiddler put: alpha/Bar'
+    assert run('git', 'log', '-n1', '--format=%h', '--abbrev=10',
+            cwd=STORE_ROOT).strip() == tiddler.revision
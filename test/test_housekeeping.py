@@ -0,0 +1,131 @@
+import os
+import logging
+
+from threading import Thread, Event
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+
+from tiddlywebplugins.gitstore import run
+from tiddlywebplugins.gitstore.housekeeping import (Housekeeper,
+        pack_loose_objects, consolidate_packs)
+
+from . import store_setup, store_teardown
+
+
+def test_repacking():
+    store, tmpdir = store_setup(housekeeping={ 'loose_limit': -1,
+            'pack_limit': 2 })
+    store_root = os.path.join(tmpdir, 'test_store')
+    errors = _ErrorRecorder()
+    logging.getLogger('tiddlywebplugins.gitstore.housekeeping').addHandler(
+            errors)
+    try:
+        housekeeper = store.storage._repository.housekeeper
+        store.put(Bag('alpha'))
+        revisions = []
+        for i in range(5):
+            tiddler = Tiddler('Foo', 'alpha')
+            tiddler.text = 'lorem ipsum %s' % i
+            store.put(tiddler)
+            housekeeper.join() # housekeeping is triggered after every commit
+            revisions.append(tiddler.revision)
+
+        assert _loose_objects(store_root) == []
+        assert housekeeper.pack_count() <= 2
+        assert run('git', 'fsck', '--strict', cwd=store_root) == ''
+
+        # repeated in-process consolidation
+        object_store = store.storage._repository.repo.object_store
+        consolidate_packs(object_store)
+        consolidate_packs(object_store)
+        assert housekeeper.pack_count() == 1
+        assert consolidate_packs(object_store) == 0
+        assert errors.records == []
+
+        for i, revision in enumerate(revisions):
+            tiddler = Tiddler('Foo', 'alpha')
+            tiddler.revision = revision
+            assert store.get(tiddler).text == 'lorem ipsum %s' % i
+    finally:
+        logging.getLogger('tiddlywebplugins.gitstore.housekeeping'
+                ).removeHandler(errors)
+        store_teardown(tmpdir)
+
+
+def test_disabled():
+    store, tmpdir = store_setup(housekeeping=False)
+    store_root = os.path.join(tmpdir, 'test_store')
+    try:
+        assert store.storage._repository.housekeeper is None
+        store.put(Bag('alpha'))
+        assert _loose_objects(store_root)
+    finally:
+        store_teardown(tmpdir)
+
+
+def _loose_objects(store_root):
+    objects_dir = os.path.join(store_root, '.git', 'objects')
+    return [filename for dirname in os.listdir(objects_dir)
+            if len(dirname) == 2
+            for filename in os.listdir(os.path.join(objects_dir, dirname))]
+
+
+class _ErrorRecorder(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self, logging.ERROR)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_concurrent_reads():
+    store, tmpdir = store_setup(housekeeping=False)
+    try:
+        repository = store.storage._repository
+        object_store = repository.repo.object_store
+        housekeeper = Housekeeper(repository.repo,
+                os.path.join(tmpdir, 'housekeeping'))
+        store.put(Bag('alpha'))
+        for i in range(20):
+            tiddler = Tiddler('Foo%s' % i, 'alpha')
+            tiddler.text = 'lorem ipsum %s' % i
+            store.put(tiddler)
+            if i % 2:
+                pack_loose_objects(object_store)
+        object_ids = list(object_store)
+
+        errors = []
+        done = Event()
+        def read():
+            while not done.is_set():
+                for object_id in object_ids:
+                    try:
+                        object_store[object_id].as_raw_string()
+                    except Exception, exc:
+                        errors.append(exc)
+
+        readers = [Thread(target=read) for i in range(4)]
+        for thread in readers:
+            thread.start()
+        try:
+            for i in range(5):
+                tiddler = Tiddler('Bar%s' % i, 'alpha')
+                tiddler.text = 'dolor sit amet %s' % i
+                store.put(tiddler)
+                pack_loose_objects(object_store)
+                housekeeper.pack_limit = 0
+                assert housekeeper.run() >= 0
+        finally:
+            done.set()
+            for thread in readers:
+                thread.join()
+
+        assert errors == []
+        assert housekeeper.pack_count() == 1
+        for object_id in list(object_store):
+            object_store[object_id]
+    finally:
+        store_teardown(tmpdir)
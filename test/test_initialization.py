@@ -1,5 +1,7 @@
 import os
 
+from tiddlyweb.store import Store
+
 from . import store_setup, store_teardown
 
 
@@ -23,3 +25,14 @@ def test_store_initialization():
     assert './test_store/recipes' in directories
     assert './test_store/users' in directories
     assert './test_store/.git' in directories
+
+
+def test_shared_repository():
+    store, tmpdir = store_setup()
+    try:
+        config = store.environ['tiddlyweb.config']
+        other_store = Store(config['server_store'][0],
+                config['server_store'][1], store.environ)
+        assert other_store.storage.repo is store.storage.repo
+    finally:
+        store_teardown(tmpdir)
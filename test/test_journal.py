@@ -0,0 +1,136 @@
+import os
+import subprocess
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+from tiddlyweb.serializer import TiddlerFormatError
+from tiddlyweb.store import NoBagError
+
+from tiddlywebplugins.gitstore import run
+from tiddlywebplugins.gitstore.repository import Repository
+
+from pytest import raises
+
+from . import store_setup, store_teardown
+
+
+def setup_module(module):
+    module.STORE, module.TMPDIR = store_setup()
+    module.STORE_ROOT = os.path.join(TMPDIR, 'test_store')
+    module.JOURNAL = os.path.join(STORE_ROOT, '.git', 'tiddlyweb', 'journal')
+
+
+def teardown_module(module):
+    store_teardown(TMPDIR)
+
+
+def test_sync_write():
+    STORE.put(Bag('alpha'))
+    tiddler = Tiddler('Foo', 'alpha')
+    tiddler.text = 'lorem ipsum'
+    STORE.put(tiddler)
+
+    assert not os.path.exists(JOURNAL)
+    assert run('git', 'status', '--porcelain', cwd=STORE_ROOT) == ''
+
+    STORE.put(tiddler) # no-op
+    assert not os.path.exists(JOURNAL)
+
+
+def test_recovery_of_live_process():
+    repository = STORE.storage._repository
+    entry = repository.journal.append('tiddler put: alpha/Foo',
+            'JohnDoe <JohnDoe@example.com>', 'tiddlyweb <tiddlyweb@example.com>',
+            ['bags/alpha/tiddlers/Foo'])
+
+    Repository(STORE_ROOT, {}) # concurrent initialization
+
+    assert repository.journal.pending() == [entry] # still in progress
+    repository.journal.complete([entry])
+    assert not os.path.exists(JOURNAL)
+
+
+def test_recovery(monkeypatch):
+    repository = STORE.storage._repository
+    # simulate a process which has since terminated
+    process = subprocess.Popen(['true'])
+    process.wait()
+    monkeypatch.setattr(os, 'getpid', lambda: process.pid)
+    entry = repository.journal.append('tiddler put: alpha/Foo',
+            'JohnDoe <JohnDoe@example.com>', 'tiddlyweb <tiddlyweb@example.com>',
+            ['bags/alpha/tiddlers/Foo'])
+    monkeypatch.undo()
+    # simulate a crash after modifying the file but before committing
+    tiddler_filename = os.path.join(STORE_ROOT, 'bags', 'alpha', 'tiddlers',
+            'Foo')
+    with open(tiddler_filename, 'a') as fh:
+        fh.write('dolor sit amet')
+    assert repository.journal.pending() == [entry]
+
+    Repository(STORE_ROOT, {}) # simulate restart
+
+    assert not os.path.exists(JOURNAL)
+    assert run('git', 'status', '--porcelain', cwd=STORE_ROOT) == ''
+    assert run('git', 'log', '-1', '--format=%s', cwd=STORE_ROOT).strip() == \
+            'tiddler put: alpha/Foo'
+
+    tiddler = STORE.get(Tiddler('Foo', 'alpha'))
+    assert tiddler.text == 'lorem ipsum\ndolor sit amet'
+
+
+def test_failed_write(monkeypatch):
+    tiddler = Tiddler('Image', 'alpha')
+    tiddler.type = 'application/octet-stream'
+    tiddler.text = '\x89PNG'
+    STORE.put(tiddler)
+    head = run('git', 'rev-parse', 'HEAD', cwd=STORE_ROOT)
+
+    # fail after the binary file has been replaced, but before its metadata
+    def failing_write(filename, contents):
+        raise IOError('disk full')
+    monkeypatch.setattr(STORE.storage, '_write_file', failing_write)
+    tiddler = Tiddler('Image', 'alpha')
+    tiddler.type = 'application/octet-stream'
+    tiddler.text = '\x89PNG\x00'
+    with raises(IOError):
+        STORE.put(tiddler)
+    monkeypatch.undo()
+
+    # changes are committed rather than being left behind
+    assert not os.path.exists(JOURNAL)
+    assert run('git', 'status', '--porcelain', cwd=STORE_ROOT) == ''
+    assert run('git', 'rev-parse', 'HEAD', cwd=STORE_ROOT) != head
+
+    # failures without modifications do not result in a commit
+    head = run('git', 'rev-parse', 'HEAD', cwd=STORE_ROOT)
+    with raises(NoBagError):
+        STORE.put(Tiddler('Foo', 'missing'))
+    tiddler = Tiddler('_binaries', 'alpha')
+    tiddler.text = 'lorem ipsum'
+    with raises(TiddlerFormatError):
+        STORE.put(tiddler)
+    assert not os.path.exists(JOURNAL)
+    assert run('git', 'rev-parse', 'HEAD', cwd=STORE_ROOT) == head
+
+
+def test_interrupted_bag_write(monkeypatch):
+    bag = Bag('gamma')
+    bag.policy.read = ['JohnDoe']
+    STORE.put(bag)
+
+    # simulate a crash while writing the bag's files
+    def failing_rename(source, target):
+        raise OSError('disk full')
+    monkeypatch.setattr(os, 'rename', failing_rename)
+    bag = Bag('gamma')
+    bag.desc = 'lorem ipsum'
+    bag.policy.read = ['JaneDoe']
+    with raises(OSError):
+        STORE.put(bag)
+    monkeypatch.undo()
+
+    # the previous contents remain intact rather than being truncated
+    assert run('git', 'status', '--porcelain', cwd=STORE_ROOT) == ''
+    bag = STORE.get(Bag('gamma'))
+    assert bag.desc == ''
+    assert bag.policy.read == ['JohnDoe']
@@ -90,3 +90,28 @@ def test_list_tiddler_revisions():
     tiddler = Tiddler('N/A', bag.name)
     with raises(NoTiddlerError):
         STORE.list_tiddler_revisions(tiddler)
+
+
+def test_list_bag_tiddlers_from_tree():
+    store_root = os.path.join(TMPDIR, 'test_store')
+
+    bag = Bag('charlie')
+    STORE.put(bag)
+    for title in ['Foo', 'Bar']:
+        STORE.put(Tiddler(title, bag.name))
+
+    # uncommitted files are not part of the listing
+    tiddlers_dir = os.path.join(store_root, 'bags', 'charlie', 'tiddlers')
+    with open(os.path.join(tiddlers_dir, 'Baz'), 'w') as fh:
+        fh.write('\n\nlorem ipsum')
+    titles = [tiddler.title for tiddler in STORE.list_bag_tiddlers(bag)]
+    assert sorted(titles) == ['Bar', 'Foo']
+    os.remove(os.path.join(tiddlers_dir, 'Baz'))
+
+    STORE.delete(bag)
+    assert run('git', 'ls-files', 'bags/charlie', cwd=store_root) == ''
+    with raises(NoBagError):
+        list(STORE.list_bag_tiddlers(bag))
+
+    STORE.put(bag)
+    assert list(STORE.list_bag_tiddlers(bag)) == []
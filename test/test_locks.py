@@ -0,0 +1,82 @@
+import os
+import time
+import shutil
+import tempfile
+
+from threading import Thread, Timer
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+
+from tiddlywebplugins.gitstore.locks import (FileLock, LockTimeout,
+        LOCK_STATS)
+
+from pytest import raises
+
+from . import store_setup, store_teardown
+
+
+def test_timeout():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'lock')
+        LOCK_STATS.reset()
+        with FileLock(filename, kind='test'):
+            with raises(LockTimeout):
+                FileLock(filename, 0.05, 'test').acquire()
+        with FileLock(filename, 0.05, 'test'):
+            pass
+
+        stats = LOCK_STATS.snapshot()['test']
+        assert stats['acquisitions'] == 2
+        assert stats['timeouts'] == 1
+        assert stats['max_wait'] >= 0.05
+
+        # waiters are woken once the lock is released
+        lock = FileLock(filename, kind='test')
+        lock.acquire()
+        timer = Timer(0.05, lock.release)
+        timer.start()
+        start = time.time()
+        with FileLock(filename, 5, 'test'):
+            assert time.time() - start < 1
+        timer.join()
+
+        # abandoned waits do not retain the lock
+        with FileLock(filename, kind='test'):
+            with raises(LockTimeout):
+                FileLock(filename, 0.05, 'test').acquire()
+        with FileLock(filename, 0.5, 'test'):
+            pass
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_concurrent_puts():
+    store, tmpdir = store_setup()
+    try:
+        store.put(Bag('alpha'))
+        LOCK_STATS.reset()
+
+        errors = []
+        def put(i):
+            tiddler = Tiddler('Foo', 'alpha')
+            tiddler.text = 'lorem ipsum %s' % i
+            try:
+                store.put(tiddler)
+            except Exception, exc:
+                errors.append(exc)
+
+        threads = [Thread(target=put, args=(i,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert len(store.list_tiddler_revisions(Tiddler('Foo', 'alpha'))) == 10
+        stats = LOCK_STATS.snapshot()
+        assert stats['path']['acquisitions'] == 10
+        assert stats['commit']['acquisitions'] == 10
+    finally:
+        store_teardown(tmpdir)
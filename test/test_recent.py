@@ -0,0 +1,102 @@
+import os
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+
+from tiddlywebplugins.gitstore.recent import RecentIndex, _reverse_lines
+
+from . import store_setup, store_teardown
+
+
+def setup_module(module):
+    module.STORE, module.TMPDIR = store_setup()
+    module.STORE_ROOT = os.path.join(module.TMPDIR, 'test_store')
+
+    for bag_name in ['alpha', 'bravo']:
+        module.STORE.put(Bag(bag_name))
+
+    for title, bag_name in [('Foo', 'alpha'), ('Bar', 'bravo'),
+            ('Baz', 'alpha'), ('Qux', 'bravo')]:
+        tiddler = Tiddler(title, bag_name)
+        tiddler.text = 'lorem ipsum'
+        module.STORE.put(tiddler)
+
+
+def teardown_module(module):
+    store_teardown(module.TMPDIR)
+
+
+def _recent(bag_name=None, limit=None):
+    return [(tiddler.bag, tiddler.title) for tiddler
+            in STORE.storage.recent_tiddlers(bag_name, limit)]
+
+
+def test_recent():
+    assert _recent() == [('bravo', 'Qux'), ('alpha', 'Baz'), ('bravo', 'Bar'),
+            ('alpha', 'Foo')]
+    assert _recent(limit=2) == [('bravo', 'Qux'), ('alpha', 'Baz')]
+    assert _recent('alpha') == [('alpha', 'Baz'), ('alpha', 'Foo')]
+    assert _recent('charlie') == []
+
+    tiddler = Tiddler('Foo', 'alpha')
+    tiddler.text = 'dolor sit amet'
+    STORE.put(tiddler)
+    STORE.delete(Tiddler('Qux', 'bravo'))
+
+    assert _recent() == [('alpha', 'Foo'), ('alpha', 'Baz'), ('bravo', 'Bar')]
+    assert _recent('bravo') == [('bravo', 'Bar')]
+
+    tiddler = list(STORE.storage.recent_tiddlers(limit=1))[0]
+    assert tiddler.revision == STORE.get(Tiddler('Foo', 'alpha')).revision
+
+
+def test_snapshot():
+    with STORE.storage.snapshot():
+        tiddler = Tiddler('Bar', 'bravo')
+        tiddler.text = 'dolor sit amet'
+        STORE.put(tiddler)
+        assert _recent(limit=1) == [('alpha', 'Foo')]
+    assert _recent(limit=1) == [('bravo', 'Bar')]
+
+
+def test_persistence():
+    index_dir = os.path.join(STORE_ROOT, '.git', 'tiddlyweb', 'recent')
+    index = RecentIndex(index_dir)
+    entries = list(index.recent(STORE.storage.repo, 'alpha'))
+    assert [title for _, title, _ in entries] == ['Foo', 'Baz']
+
+    index.rebuild(STORE.storage.repo)
+    assert list(index.recent(STORE.storage.repo, 'alpha')) == entries
+
+
+def test_reverse_lines():
+    filename = os.path.join(TMPDIR, 'lines')
+    lines = ['%s %s' % (i, 'x' * (i % 7000)) for i in range(100)]
+    with open(filename, 'w') as fh:
+        fh.write('\n'.join(lines) + '\n' + 'incomplete')
+    assert list(_reverse_lines(filename)) == list(reversed(lines))
+
+    with open(filename, 'w') as fh:
+        fh.write('incomplete')
+    assert list(_reverse_lines(filename)) == []
+
+
+def test_reset():
+    repo = STORE.storage.repo
+    index = RecentIndex(os.path.join(STORE_ROOT, '.git', 'tiddlyweb',
+            'recent'))
+    entries = list(index.recent(repo, 'alpha'))
+
+    head = repo.head()
+    tiddler = Tiddler('Corge', 'alpha')
+    tiddler.text = 'lorem ipsum'
+    STORE.put(tiddler)
+    assert [title for _, title, _ in index.recent(repo, 'alpha')][0] == 'Corge'
+
+    # HEAD becoming an ancestor of the indexed commit
+    latest = repo.head()
+    repo.refs['refs/heads/master'] = head
+    try:
+        assert list(index.recent(repo, 'alpha')) == entries
+    finally:
+        repo.refs['refs/heads/master'] = latest
@@ -27,6 +27,11 @@ def test_recipe_put():
             'JohnDoe@example.com tiddlyweb@example.com: recipe put: omega'
     assert run('git', 'diff', '--exit-code', cwd=store_root) == ''
 
+    # identical contents do not result in an empty commit
+    head = run('git', 'rev-parse', 'HEAD', cwd=store_root)
+    STORE.put(Recipe('omega'))
+    assert run('git', 'rev-parse', 'HEAD', cwd=store_root) == head
+
 
 def test_recipe_delete():
     recipe = Recipe('omega')
@@ -0,0 +1,118 @@
+import os
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+
+from tiddlywebplugins.gitstore import run
+from tiddlywebplugins.gitstore.revisions import RevisionIndex
+
+from . import store_setup, store_teardown
+
+
+def setup_module(module):
+    module.STORE, module.TMPDIR = store_setup()
+    module.STORE_ROOT = os.path.join(module.TMPDIR, 'test_store')
+
+
+def teardown_module(module):
+    store_teardown(module.TMPDIR)
+
+
+def test_persistence():
+    bag = Bag('alpha')
+    STORE.put(bag)
+
+    for text in ['lipsum', 'lorem ipsum', 'lorem ipsum\ndolor sit amet']:
+        tiddler = Tiddler('Foo', bag.name)
+        tiddler.text = text
+        STORE.put(tiddler)
+
+    path = 'bags/alpha/tiddlers/Foo'
+    expected = run('git', 'log', '--format=%H', '--', path,
+            cwd=STORE_ROOT).splitlines()
+    assert len(expected) == 3
+
+    index_dir = os.path.join(STORE_ROOT, '.git', 'tiddlyweb', 'revisions')
+    assert os.path.isfile(os.path.join(index_dir, 'HEAD'))
+
+    # a fresh instance must not need to walk history
+    index = RevisionIndex(index_dir)
+    assert index.revisions(STORE.storage.repo, path) == expected
+    assert index.latest(STORE.storage.repo, path) == expected[0]
+
+    index.rebuild(STORE.storage.repo)
+    assert index.revisions(STORE.storage.repo, path) == expected
+
+
+def test_incremental_update():
+    bag = Bag('alpha')
+    STORE.put(bag)
+
+    index_dir = os.path.join(STORE_ROOT, '.git', 'tiddlyweb', 'revisions')
+    index = RevisionIndex(index_dir)
+    path = 'bags/alpha/tiddlers/Bar'
+    assert index.revisions(STORE.storage.repo, path) == []
+
+    tiddler = Tiddler('Bar', bag.name)
+    tiddler.text = 'lorem ipsum'
+    STORE.put(tiddler)
+
+    revisions = index.revisions(STORE.storage.repo, path)
+    assert len(revisions) == 1
+    assert revisions[0].startswith(tiddler.revision)
+
+    # simulate an update interrupted before the marker was written
+    index._write_marker(STORE.storage.repo[revisions[0]].parents[0])
+    index.head = None
+    assert index.revisions(STORE.storage.repo, path) == revisions
+
+
+def test_reset():
+    repo = STORE.storage.repo
+    bag = Bag('alpha')
+    path = 'bags/alpha/tiddlers/Baz'
+    for text in ['lorem ipsum', 'dolor sit amet']:
+        tiddler = Tiddler('Baz', bag.name)
+        tiddler.text = text
+        STORE.put(tiddler)
+
+    index_dir = os.path.join(STORE_ROOT, '.git', 'tiddlyweb', 'revisions')
+    index = RevisionIndex(index_dir)
+    revisions = index.revisions(repo, path)
+    assert len(revisions) == 2
+
+    # HEAD becoming an ancestor of the indexed commit
+    head = repo.head()
+    repo.refs['refs/heads/master'] = revisions[1]
+    try:
+        assert index.revisions(repo, path) == revisions[1:]
+    finally:
+        repo.refs['refs/heads/master'] = head
+    assert index.revisions(repo, path) == revisions
+
+
+def test_commit_changes(monkeypatch):
+    repo = STORE.storage.repo
+    repository = STORE.storage._repository
+    index = repository.revisions
+    foo_path = 'bags/alpha/tiddlers/Foo'
+    qux_path = 'bags/alpha/tiddlers/Qux'
+    foo_revisions = index.revisions(repo, foo_path)
+
+    def compare_trees(*args):
+        raise AssertionError('commits should be indexed based on their changes')
+    monkeypatch.setattr(RevisionIndex, '_update', compare_trees)
+
+    tiddler = Tiddler('Qux', 'alpha')
+    tiddler.text = 'lorem ipsum'
+    STORE.put(tiddler)
+    with open(os.path.join(STORE_ROOT, qux_path), 'a') as fh:
+        fh.write('dolor sit amet')
+    # unchanged files do not gain revisions
+    commit_id = repository.commit([('test commit', 'JohnDoe <jd@example.com>',
+            [foo_path, qux_path])], 'tiddlyweb <tiddlyweb@example.com>')
+
+    assert index.revisions(repo, foo_path) == foo_revisions
+    qux_revisions = index.revisions(repo, qux_path)
+    assert len(qux_revisions) == 2
+    assert qux_revisions[0] == commit_id
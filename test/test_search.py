@@ -0,0 +1,81 @@
+# coding=UTF-8
+
+import os
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+
+from tiddlywebplugins.gitstore.index import PostingsIndex
+from tiddlywebplugins.gitstore.search import SearchIndex
+from tiddlywebplugins.gitstore.recent import RecentIndex
+from tiddlywebplugins.gitstore.revisions import RevisionIndex
+
+from . import store_setup, store_teardown
+
+
+def setup_module(module):
+    module.STORE, module.TMPDIR = store_setup()
+    module.STORE_ROOT = os.path.join(module.TMPDIR, 'test_store')
+
+    for bag_name in ['alpha', 'bravo']:
+        module.STORE.put(Bag(bag_name))
+
+    for title, bag_name, text, tags in [
+            ('Foo', 'alpha', 'lorem ipsum dolor sit amet', ['hello']),
+            ('Bar', 'alpha', 'consectetur adipisicing elit', ['world']),
+            ('Baz', 'bravo', 'Lorem Ipsum', []),
+            (u'Ünïcode Title', 'bravo', u'sed do eiusmod', [u'ümlaut'])]:
+        tiddler = Tiddler(title, bag_name)
+        tiddler.text = text
+        tiddler.tags = tags
+        tiddler.fields['subtitle'] = u'%s subtitle' % title
+        module.STORE.put(tiddler)
+
+
+def teardown_module(module):
+    store_teardown(module.TMPDIR)
+
+
+def _search(query):
+    return sorted((tiddler.bag, tiddler.title) for tiddler
+            in STORE.search(query))
+
+
+def test_search():
+    assert _search('lorem') == [('alpha', 'Foo'), ('bravo', 'Baz')]
+    assert _search('lorem dolor') == [('alpha', 'Foo')]
+    assert _search('bar') == [('alpha', 'Bar')] # title
+    assert _search('world') == [('alpha', 'Bar')] # tag
+    assert _search('baz subtitle') == [('bravo', 'Baz')] # field
+    assert _search(u'ümlaut') == [('bravo', u'Ünïcode Title')]
+    assert _search(u'ÜNÏCODE') == [('bravo', u'Ünïcode Title')]
+    assert _search('lorem elit') == []
+    assert _search('') == []
+
+
+def test_incremental_update(monkeypatch):
+    def compare_trees(*args):
+        raise AssertionError('commits should be indexed based on their changes')
+    # ensures put latency does not grow with the number of tiddlers
+    for index in (PostingsIndex, RecentIndex, RevisionIndex):
+        monkeypatch.setattr(index, '_update', compare_trees)
+
+    tiddler = Tiddler('Foo', 'alpha')
+    tiddler.text = 'hello world'
+    STORE.put(tiddler)
+
+    assert _search('lorem') == [('bravo', 'Baz')]
+    assert _search('hello') == [('alpha', 'Foo')]
+
+    STORE.delete(Tiddler('Baz', 'bravo'))
+    assert _search('lorem') == []
+    assert _search('eiusmod') == [('bravo', u'Ünïcode Title')]
+
+
+def test_rebuild():
+    index_dir = os.path.join(STORE_ROOT, '.git', 'tiddlyweb', 'search')
+    index = SearchIndex(index_dir)
+    repo = STORE.storage.repo
+    index.rebuild(repo)
+    assert list(index.search(repo, 'eiusmod')) == [('bravo', u'Ünïcode Title')]
+    assert list(index.search(repo, 'lorem')) == []
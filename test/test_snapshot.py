@@ -0,0 +1,129 @@
+import os
+
+from StringIO import StringIO
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+
+from tiddlywebplugins.gitstore.streams import FileStream
+
+from pytest import raises
+
+from . import store_setup, store_teardown
+
+
+def setup_module(module):
+    module.STORE, module.TMPDIR = store_setup(binary_stream_threshold=16)
+
+
+def teardown_module(module):
+    store_teardown(module.TMPDIR)
+
+
+def test_pinned_reads():
+    storage = STORE.storage
+    STORE.put(Bag('alpha'))
+    tiddler = Tiddler('Foo', 'alpha')
+    tiddler.text = 'lorem ipsum'
+    STORE.put(tiddler)
+    old_revision = tiddler.revision
+
+    with storage.snapshot() as commit_id:
+        assert commit_id.startswith(old_revision)
+
+        tiddler = Tiddler('Foo', 'alpha')
+        tiddler.text = 'dolor sit amet'
+        STORE.put(tiddler)
+        new_revision = tiddler.revision
+        tiddler = Tiddler('Bar', 'alpha')
+        tiddler.text = 'consectetur'
+        STORE.put(tiddler)
+
+        tiddler = STORE.get(Tiddler('Foo', 'alpha'))
+        assert tiddler.text == 'lorem ipsum'
+        assert tiddler.revision == old_revision
+        titles = [tiddler.title
+                for tiddler in STORE.list_bag_tiddlers(Bag('alpha'))]
+        assert titles == ['Foo']
+        with raises(Exception):
+            STORE.get(Tiddler('Bar', 'alpha'))
+
+    tiddler = STORE.get(Tiddler('Foo', 'alpha'))
+    assert tiddler.text == 'dolor sit amet'
+    assert tiddler.revision == new_revision
+    titles = [tiddler.title for tiddler in STORE.list_bag_tiddlers(Bag('alpha'))]
+    assert sorted(titles) == ['Bar', 'Foo']
+
+    storage.pin_snapshot(commit_id)
+    try:
+        assert STORE.get(Tiddler('Foo', 'alpha')).text == 'lorem ipsum'
+    finally:
+        storage.unpin_snapshot()
+    assert STORE.get(Tiddler('Foo', 'alpha')).text == 'dolor sit amet'
+
+    with raises(ValueError):
+        storage.pin_snapshot('deadbeef')
+
+
+def test_pinned_binary_reads():
+    storage = STORE.storage
+    tiddler = Tiddler('Image', 'alpha')
+    tiddler.type = 'application/octet-stream'
+    tiddler.text = StringIO('\x00' * 64)
+    STORE.put(tiddler)
+
+    tiddler = STORE.get(Tiddler('Image', 'alpha'))
+    assert isinstance(tiddler.text, FileStream)
+    assert tiddler.text.read() == '\x00' * 64
+    tiddler.text.close()
+
+    with storage.snapshot():
+        tiddler = Tiddler('Image', 'alpha')
+        tiddler.type = 'application/octet-stream'
+        tiddler.text = StringIO('\x01' * 64)
+        STORE.put(tiddler)
+
+        # working tree no longer matches the snapshot
+        tiddler = STORE.get(Tiddler('Image', 'alpha'))
+        assert tiddler.text == '\x00' * 64
+
+    tiddler = STORE.get(Tiddler('Image', 'alpha'))
+    assert tiddler.text.read() == '\x01' * 64
+    tiddler.text.close()
+
+    # contents replaced without their metadata, e.g. by a concurrent write
+    binary_file = os.path.join(TMPDIR, 'test_store', 'bags', 'alpha',
+            'tiddlers', '_binaries', 'Image')
+    with open(binary_file + '.tmp', 'wb') as fh:
+        fh.write('\x02' * 64)
+    os.rename(binary_file + '.tmp', binary_file)
+    tiddler = STORE.get(Tiddler('Image', 'alpha'))
+    assert tiddler.text == '\x01' * 64
+
+
+def test_bare_writes_ignore_snapshot():
+    store, tmpdir = store_setup('tiddlywebplugins.gitstore.bare')
+    try:
+        store.put(Bag('alpha'))
+        tiddler = Tiddler('Foo', 'alpha')
+        tiddler.text = 'lorem ipsum'
+        tiddler.modifier = 'JohnDoe'
+        store.put(tiddler)
+
+        with store.storage.snapshot():
+            tiddler = Tiddler('Foo', 'alpha')
+            tiddler.text = 'dolor sit amet'
+            tiddler.modifier = 'JaneDoe'
+            store.put(tiddler)
+            tiddler = Tiddler('Foo', 'alpha')
+            tiddler.text = 'consectetur'
+            tiddler.modifier = 'JimDoe'
+            store.put(tiddler)
+            assert store.get(Tiddler('Foo', 'alpha')).text == 'lorem ipsum'
+
+        tiddler = store.get(Tiddler('Foo', 'alpha'))
+        assert tiddler.text == 'consectetur'
+        assert tiddler.creator == 'JohnDoe'
+        assert len(store.list_tiddler_revisions(tiddler)) == 3
+    finally:
+        store_teardown(tmpdir)
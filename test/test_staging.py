@@ -0,0 +1,51 @@
+import os
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+
+from tiddlywebplugins.gitstore import run
+
+from . import store_setup, store_teardown
+
+
+def setup_module(module):
+    module.STORE, module.TMPDIR = store_setup()
+    module.STORE_ROOT = os.path.join(TMPDIR, 'test_store')
+
+
+def teardown_module(module):
+    store_teardown(TMPDIR)
+
+
+def test_index_reuse():
+    repository = STORE.storage._repository
+    STORE.put(Bag('alpha'))
+    index = repository._index
+
+    for title in ['Foo', 'Bar']:
+        tiddler = Tiddler(title, 'alpha')
+        tiddler.text = 'lorem ipsum'
+        STORE.put(tiddler)
+    assert repository._index is index
+    assert run('git', 'status', '--porcelain', cwd=STORE_ROOT) == ''
+
+    STORE.delete(Tiddler('Foo', 'alpha'))
+    assert run('git', 'status', '--porcelain', cwd=STORE_ROOT) == ''
+    assert run('git', 'ls-tree', '--name-only', 'HEAD', 'bags/alpha/tiddlers/',
+            cwd=STORE_ROOT).splitlines() == ['bags/alpha/tiddlers/.gitkeep',
+            'bags/alpha/tiddlers/Bar']
+
+
+def test_external_index_modification():
+    repository = STORE.storage._repository
+    with open(os.path.join(STORE_ROOT, 'README'), 'w') as fh:
+        fh.write('lorem ipsum')
+    run('git', 'add', 'README', cwd=STORE_ROOT)
+
+    tiddler = Tiddler('Baz', 'alpha')
+    tiddler.text = 'lorem ipsum'
+    STORE.put(tiddler)
+
+    assert 'README' in repository._index
+    # only the tiddler is committed
+    assert run('git', 'status', '--porcelain', cwd=STORE_ROOT) == 'A  README\n'
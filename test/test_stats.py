@@ -0,0 +1,55 @@
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+
+from tiddlywebplugins.gitstore.stats import (AGGREGATE, SINKS, ENVIRON_KEY,
+        deactivate)
+
+from . import store_setup, store_teardown
+
+
+RECORDED = []
+
+
+def record(phase, duration): # custom sink
+    RECORDED.append(phase)
+
+
+def test_timings():
+    store, tmpdir = store_setup(stats_sink=__name__)
+    try:
+        AGGREGATE.reset()
+        timings = store.environ[ENVIRON_KEY]
+        assert timings is store.storage.timings
+
+        store.put(Bag('alpha'))
+        tiddler = Tiddler('Foo', 'alpha')
+        tiddler.text = 'lorem ipsum'
+        store.put(tiddler)
+        store.get(Tiddler('Foo', 'alpha'))
+
+        phases = timings.snapshot()
+        for phase in ['lock:path', 'lock:commit', 'journal', 'serialize',
+                'write', 'stage', 'commit', 'index', 'revisions', 'read']:
+            assert phases[phase]['count'] > 0
+            assert phases[phase]['time'] >= 0
+        assert phases['commit']['count'] == 2
+
+        assert AGGREGATE.snapshot()['commit']['count'] == 2
+        assert RECORDED.count('commit') == 2
+    finally:
+        SINKS.remove(__import__(__name__, {}, {}, ['record']))
+        store_teardown(tmpdir)
+
+
+def test_deactivation():
+    store, tmpdir = store_setup()
+    try:
+        timings = store.storage.timings
+        store.put(Bag('alpha'))
+        count = timings.snapshot()['commit']['count']
+
+        deactivate(store.environ)
+        store.put(Bag('beta'))
+        assert timings.snapshot()['commit']['count'] == count
+    finally:
+        store_teardown(tmpdir)
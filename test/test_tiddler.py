@@ -119,6 +119,38 @@ def test_tiddler_put():
     assert tiddler.tags == ['foo']
 
 
+def test_identical_put():
+    store_root = os.path.join(TMPDIR, 'test_store')
+
+    tiddler = Tiddler('Qux', 'alpha')
+    tiddler.text = 'lorem ipsum'
+    tiddler.modified = '20200101000000'
+    STORE.put(tiddler)
+    revision = tiddler.revision
+    head = run('git', 'rev-parse', 'HEAD', cwd=store_root)
+
+    tiddler = Tiddler('Qux', 'alpha')
+    tiddler.text = 'lorem ipsum'
+    tiddler.modified = '20200101000000'
+    STORE.put(tiddler)
+    assert tiddler.revision == revision
+    assert run('git', 'rev-parse', 'HEAD', cwd=store_root) == head
+
+    stored_tiddler = Tiddler('Qux', 'alpha')
+    stored_tiddler.revision = tiddler.revision
+    stored_tiddler = STORE.get(stored_tiddler)
+    assert stored_tiddler.text == 'lorem ipsum'
+    assert stored_tiddler.revision == revision
+
+    # only the modification time differs
+    tiddler = Tiddler('Qux', 'alpha')
+    tiddler.text = 'lorem ipsum'
+    tiddler.modified = '20250101000000'
+    STORE.put(tiddler)
+    assert tiddler.revision != revision
+    assert STORE.get(Tiddler('Qux', 'alpha')).modified == '20250101000000'
+
+
 def test_tiddler_delete():
     store_root = os.path.join(TMPDIR, 'test_store')
 
@@ -208,3 +240,51 @@ def test_unicode_strings():
     assert tid.bag == name
     assert tid.title == name
     assert tid.text == name
+
+
+def test_tiddler_get_without_subprocess(monkeypatch):
+    bag = Bag('alpha')
+    STORE.put(bag)
+
+    tiddler = Tiddler('Lipsum', bag.name)
+    tiddler.text = 'lorem ipsum'
+    STORE.put(tiddler)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('unexpected subprocess: %s' % (args,))
+    monkeypatch.setattr(subprocess, 'check_output', fail)
+
+    stored_tiddler = STORE.get(Tiddler('Lipsum', bag.name))
+    assert stored_tiddler.revision == tiddler.revision
+
+    store_root = os.path.join(TMPDIR, 'test_store')
+    monkeypatch.undo()
+    revision = run('git', 'log', '-n1', '--format=%h', '--abbrev=10', '--',
+            'bags/alpha/tiddlers/Lipsum', cwd=store_root)
+    assert revision.strip() == stored_tiddler.revision
+
+
+def test_revision_get_without_subprocess(monkeypatch):
+    bag = Bag('alpha')
+    STORE.put(bag)
+
+    revisions = []
+    for text in ['lipsum', 'lorem ipsum']:
+        tiddler = Tiddler('Dolor', bag.name)
+        tiddler.text = text
+        tiddler.tags = ['foo']
+        STORE.put(tiddler)
+        revisions.append(tiddler.revision)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('unexpected subprocess: %s' % (args,))
+    monkeypatch.setattr(subprocess, 'check_output', fail)
+
+    for i in range(2): # second iteration is served from cache
+        tiddler = Tiddler('Dolor', bag.name)
+        tiddler.revision = revisions[0]
+        tiddler = STORE.get(tiddler)
+        assert tiddler.text == 'lipsum'
+        assert tiddler.revision == revisions[0]
+        tiddler.tags.append('bar') # must not affect cached data
+        assert tiddler.tags == ['foo', 'bar']
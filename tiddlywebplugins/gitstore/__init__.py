@@ -6,48 +6,174 @@ store uses Git to keep track of tiddler revisions
 """
 
 import os
-import time
+import re
+import posixpath
+import sys
+import stat
+import logging
+import tempfile
 import subprocess
 import urllib
 
-from datetime import datetime
+import simplejson
 
-from dulwich.repo import Repo
-from dulwich.errors import NotGitRepository
+from copy import deepcopy
+from itertools import islice
+from contextlib import contextmanager
 
+from dulwich.diff_tree import tree_changes
+from dulwich.objects import Blob
+
+from tiddlyweb.model.policy import Policy
 from tiddlyweb.model.tiddler import Tiddler
 from tiddlyweb.serializer import TiddlerFormatError
-from tiddlyweb.store import StoreLockError, NoBagError, NoTiddlerError
+from tiddlyweb.store import (NoBagError, NoRecipeError, NoTiddlerError,
+        StoreEncodingError)
 from tiddlyweb.stores.text import Store as TextStore, _encode_filename
-from tiddlyweb.util import (binary_tiddler, LockError, write_lock, write_unlock,
-        read_utf8_file, write_utf8_file)
+from tiddlyweb.util import binary_tiddler, read_utf8_file
+
+from .repository import get_repository
+from .cache import TIDDLERS, LISTINGS, TREES, PARSED_TREES, DIFFS
+from .diff import diff_tiddlers
+from .streams import write_stream, file_digest, verified_stream, FileStream
+from .stats import activate, timed
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+BINARY_STREAM_THRESHOLD = 1024 * 1024 # bytes
+
+BINCUE = '~.~.~bincue~.~.~ sha1:%s'
+BINCUE_PATTERN = re.compile(r'^~\.~\.~bincue~\.~\.~ sha1:([0-9a-f]{40})$')
+
+SNAPSHOT_KEY = 'tiddlyweb.gitstore.snapshot'
 
 
 class Store(TextStore):
 
     def __init__(self, store_config=None, environ=None):
         super(Store, self).__init__(store_config, environ)
+        self._repository = get_repository(self._root, store_config)
+        self.repo = self._repository.repo
+        self._revisions = self._repository.revisions
+        self._search = self._repository.search
+        self._attributes = self._repository.attributes
+        self._recent = self._repository.recent
+        self._stream_threshold = store_config.get('binary_stream_threshold',
+                BINARY_STREAM_THRESHOLD)
+        self.timings = activate(self.environ)
+
+    def pin_snapshot(self, commit_id=None):
+        """
+        serve subsequent reads within the current request from the given commit
+        (a full commit ID), defaulting to the latest one, so that multiple reads
+        (e.g. of a recipe's tiddlers) reflect the same state
+
+        returns the pinned commit's ID, None if there are no commits yet
+
+        raises ValueError if `commit_id` is not a known commit
+        """
+        if commit_id is None:
+            try:
+                commit_id = self._head()
+            except KeyError: # no commits yet
+                commit_id = None
+        else:
+            commit_id = self._resolve_commit(commit_id)
+        self.environ[SNAPSHOT_KEY] = commit_id
+        return commit_id
+
+    def unpin_snapshot(self):
+        """
+        serve subsequent reads from the latest commit again
+        """
+        self.environ.pop(SNAPSHOT_KEY, None)
+
+    @contextmanager
+    def snapshot(self, commit_id=None):
+        """
+        pin a snapshot (see `pin_snapshot`) for the duration of the block,
+        yielding the respective commit ID
+        """
+        previous = self.environ.get(SNAPSHOT_KEY)
         try:
-            self.repo = Repo(self._root)
-        except NotGitRepository:
-            self.repo = Repo.init(self._root)
+            yield self.pin_snapshot(commit_id)
+        finally:
+            self.environ[SNAPSHOT_KEY] = previous
 
     def list_bag_tiddlers(self, bag):
+        """
+        list tiddlers as of the current snapshot, based on the respective tree
+        """
         tiddlers_dir = self._tiddlers_dir(bag.name)
-
+        relative_path = os.path.relpath(tiddlers_dir, start=self._root)
         try:
-            tiddler_files = (filename for filename
-                    in self._files_in_dir(tiddlers_dir)
-                    if not filename == '.gitkeep')
-        except (IOError, OSError), exc:
+            tree_id = self._tree_id(relative_path)
+        except KeyError, exc:
             raise NoBagError('unable to list tiddlers in bag "%s": %s' %
                     (bag.name, exc))
 
-        bin_dir = os.path.basename(self._binaries_dir(bag.name))
-        for filename in tiddler_files:
-            if not filename == bin_dir:
-                title = urllib.unquote(filename).decode('utf-8')
-                yield Tiddler(title, bag.name)
+        titles = LISTINGS.get(tree_id)
+        if titles is None:
+            bin_dir = os.path.basename(self._binaries_dir(bag.name))
+            titles = [urllib.unquote(filename).decode('utf-8')
+                    for filename in self.repo[tree_id]
+                    if filename not in ('.gitkeep', bin_dir)]
+            LISTINGS.add(tree_id, titles)
+
+        for title in titles:
+            yield Tiddler(title, bag.name)
+
+    def tiddler_changes(self, bag_name, since=None):
+        """
+        determine which tiddlers in the given bag have changed between commit
+        `since` (a full commit ID, None for the empty state) and the current
+        snapshot's commit, comparing only the bag's subtree
+
+        returns a dictionary with the snapshot's commit ID as `head`, to be passed
+        as `since` subsequently, along with lists of `added`, `modified` and
+        `deleted` titles
+
+        raises NoBagError if the bag does not exist and ValueError if `since` is
+        not a known commit
+        """
+        relative_path = os.path.relpath(self._tiddlers_dir(bag_name),
+                start=self._root)
+        try:
+            head = self._snapshot()
+            new_tree = self._tree_id(relative_path, head)
+        except KeyError, exc:
+            raise NoBagError('unable to list changes in bag "%s": %s' %
+                    (bag_name, exc))
+
+        old_tree = None
+        if since is not None:
+            commit = self.repo[self._resolve_commit(since)]
+            try:
+                tree = self.repo[commit.tree]
+                mode, old_tree = tree.lookup_path(
+                        self.repo.object_store.__getitem__, relative_path)
+            except KeyError: # bag did not exist yet
+                old_tree = None
+
+        changes = { 'head': head, 'added': [], 'modified': [], 'deleted': [] }
+        if old_tree == new_tree:
+            return changes
+
+        for change in tree_changes(self.repo.object_store, old_tree, new_tree):
+            path = change.new.path or change.old.path
+            # binary contents are reflected by the respective metadata file
+            if '/' in path or path == '.gitkeep':
+                continue
+            title = urllib.unquote(path).decode('utf-8')
+            if change.type == 'add':
+                changes['added'].append(title)
+            elif change.type == 'delete':
+                changes['deleted'].append(title)
+            else:
+                changes['modified'].append(title)
+        return changes
 
     def list_tiddler_revisions(self, tiddler):
         tiddler_filename = self._tiddler_base_filename(tiddler)
@@ -55,59 +181,113 @@ class Store(TextStore):
             raise NoTiddlerError('unable to list revisions for tiddler "%s"'
                     % tiddler.title)
 
-        try:
-            relative_path = os.path.relpath(tiddler_filename, start=self._root)
-            revisions = run('git', 'log', '--format=%H', '--', relative_path,
-                    cwd=self._root) # TODO: should be handled via Dulwich
-        except subprocess.CalledProcessError, exc:
-            raise NoTiddlerError('unable to list revisions for tiddler "%s": %s'
-                    % (tiddler.title, exc))
+        relative_path = os.path.relpath(tiddler_filename, start=self._root)
+        revisions = self._revisions.revisions(self.repo, relative_path)
 
-        return [rev[:10] for rev in revisions.splitlines()]
+        return [rev[:10] for rev in revisions]
 
-    def tiddler_get(self, tiddler): # XXX: prone to race condition due to separate Git operation
+    def tiddler_get(self, tiddler):
+        """
+        retrieve a tiddler as of the current snapshot (see `pin_snapshot`), so
+        contents and revision are always consistent with each other
+        """
         tiddler_filename = self._tiddler_base_filename(tiddler)
 
         if tiddler.revision:
             return self._get_tiddler_revision(tiddler, tiddler_filename)
 
+        if self._repository.writer: # include writes not committed yet
+            return self._get_working_tiddler(tiddler, tiddler_filename)
+
+        relative_path = self._relative_path(tiddler_filename)
         try:
-            tiddler = self._read_tiddler_file(tiddler, tiddler_filename)
-        except IOError, exc:
+            snapshot = self._snapshot()
+            blob_id = self._blob_id(relative_path, snapshot)
+        except KeyError, exc:
             raise NoTiddlerError('no tiddler for "%s": %s' %
                     (tiddler.title, exc))
 
-        relative_path = os.path.relpath(tiddler_filename, start=self._root)
-        revision = run('git', 'log', '-n1', '--format=%H', '--', relative_path,
-                cwd=self._root) # TODO: should be handled via Dulwich
-        tiddler.revision = revision.strip()[:10]
+        tiddler = self._read_tiddler_blob(blob_id, tiddler)
+        revision = self._revisions.latest(self.repo, relative_path, snapshot)
+        tiddler.revision = revision[:10] if revision else None
 
         if binary_tiddler(tiddler):
-            with open(self._binary_filename(tiddler), 'rb') as fh:
-                tiddler.text = fh.read() # XXX: is it this simple?
+            tiddler.text = self._read_binary(tiddler, snapshot)
 
         return tiddler
 
     def tiddler_put(self, tiddler):
+        msg = 'tiddler put: %s/%s' % (tiddler.bag, tiddler.title)
+        with self._transaction(msg, *self._tiddler_files(tiddler)) as trx:
+            if not self._write_tiddler(tiddler): # no-op
+                trx.cancel()
+
+        if trx.cancelled:
+            tiddler.revision = self._current_revision(tiddler)
+        elif trx.commit_id:
+            # the commit might not include the tiddler if its contents were
+            # identical
+            tiddler.revision = self._current_revision(tiddler, trx.commit_id)
+        else: # deferred
+            tiddler.revision = None
+
+    def put_tiddlers(self, tiddlers):
+        """
+        write multiple tiddlers, committing them all at once
+
+        this is intended for bulk imports and bypasses the respective hooks of
+        TiddlyWeb's store wrapper
+
+        returns the list of tiddlers, all changed ones having the same revision
+        """
+        tiddlers = list(tiddlers)
+        if not tiddlers:
+            return tiddlers
+
+        # also ensures bags exist before writing anything
+        commit_files = [filename for tiddler in tiddlers
+                for filename in self._tiddler_files(tiddler)]
+
+        bags = sorted(set(tiddler.bag for tiddler in tiddlers))
+        msg = 'tiddlers put: %s tiddlers in %s' % (len(tiddlers),
+                ', '.join(bags))
+        changed = []
+        with self._transaction(msg, *commit_files) as trx:
+            for tiddler in tiddlers:
+                if self._write_tiddler(tiddler):
+                    changed.append(tiddler)
+                else: # no-op
+                    tiddler.revision = self._current_revision(tiddler)
+            if not changed:
+                trx.cancel()
+
+        for tiddler in changed:
+            tiddler.revision = (trx.commit_id and
+                    self._current_revision(tiddler, trx.commit_id))
+        return tiddlers
+
+    def _tiddler_files(self, tiddler):
+        """
+        returns the names of the files representing the given tiddler
+        """
+        filenames = [self._tiddler_base_filename(tiddler)]
+        if binary_tiddler(tiddler):
+            filenames.append(self._binary_filename(tiddler))
+        return filenames
+
+    def _write_tiddler(self, tiddler):
+        """
+        write tiddler to disk without committing it
+
+        the caller is expected to hold the respective path locks
+
+        returns False if the tiddler is unchanged, True otherwise
+        """
         tiddler_filename = self._tiddler_base_filename(tiddler)
         bin_dir = self._binaries_dir(tiddler.bag)
         if tiddler_filename == bin_dir:
             raise TiddlerFormatError("reserved tiddler title")
 
-        # the following section is copied almost verbatim from the text store
-        # TODO: refactor the text store for granular reusability
-        locked = 0
-        lock_attempts = 0
-        while not locked:
-            try:
-                lock_attempts = lock_attempts + 1
-                write_lock(tiddler_filename)
-                locked = 1
-            except LockError, exc:
-                if lock_attempts > 4:
-                    raise StoreLockError(exc)
-                time.sleep(.1)
-
         # Protect against incoming tiddlers that have revision set. Since we are
         # putting a new one, we want the system to calculate.
         tiddler.revision = None
@@ -119,6 +299,7 @@ class Store(TextStore):
             tiddler.creator = current_rev.creator
             tiddler.created = current_rev.created
         except IOError, exc: # first revision
+            current_rev = None
             tiddler.creator = tiddler.modifier
             tiddler.created = tiddler.modified
 
@@ -129,106 +310,439 @@ class Store(TextStore):
             except OSError, exc: # already exists
                 pass
             binary_filename = self._binary_filename(tiddler)
-            with open(binary_filename, 'wb') as fh:
-                fh.write(tiddler.text) # XXX: is it this simple?
+            fd, tmp_filename = tempfile.mkstemp(dir=self.repo.controldir())
+            os.close(fd)
+            os.chmod(tmp_filename, 0644)
+            with timed('write'):
+                digest = write_stream(tmp_filename, tiddler.text)
             binary_data = tiddler.text
             # ensure metadata file changes when binary contents change, thus
             # making it part of any commit - the metadata file is considered the
             # authoritative source for revisions
-            tiddler.text = '~.~.~bincue~.~.~ %s' % datetime.now()
+            tiddler.text = BINCUE % digest
 
-        write_utf8_file(tiddler_filename,
-                self.serializer.serialization.tiddler_as(tiddler))
-        write_unlock(tiddler_filename)
+            if current_rev and _unchanged(current_rev, tiddler):
+                os.remove(tmp_filename)
+                tiddler.text = binary_data
+                return False
+            os.rename(tmp_filename, binary_filename)
 
-        commit_files = [tiddler_filename]
+        self._write_file(tiddler_filename, self._serialize(tiddler))
 
         if binary_data is not None:
             tiddler.text = binary_data # restore original
-            commit_files.append(binary_filename)
 
-        msg = 'tiddler put: %s/%s' % (tiddler.bag, tiddler.title)
-        commit_id = self._commit(msg, *commit_files)
-        tiddler.revision = commit_id[:10]
+        return True
 
-    def tiddler_delete(self, tiddler): # XXX: prone to race condition due to separate Git operation
+    def tiddler_delete(self, tiddler):
         tiddler_filename = self._tiddler_base_filename(tiddler)
         if not os.path.exists(tiddler_filename):
             raise NoTiddlerError('%s not present' % tiddler_filename)
 
-        os.remove(tiddler_filename)
+        tiddler_files = [tiddler_filename]
         if binary_tiddler(tiddler):
-            run('git', 'rm', self._binary_filename(tiddler), cwd=self._root) # TODO: should be handled via Dulwich
+            tiddler_files.append(self._binary_filename(tiddler))
 
         msg = 'tiddler delete: %s/%s' % (tiddler.bag, tiddler.title)
-        self._commit(msg, tiddler_filename)
-
-    def bag_put(self, bag): # XXX: prone to race condition due to separate Git operation
-        super(Store, self).bag_put(bag)
+        with self._transaction(msg, *tiddler_files):
+            for filename in tiddler_files:
+                os.remove(filename)
 
+    def bag_put(self, bag):
         bag_path = self._bag_path(bag.name)
-
         bag_files = self._bag_files(bag_path)
-        keepfile = bag_files[-1]
-        with file(keepfile, 'a'):
-            os.utime(keepfile, None) # `touch`
-
-        self._commit('bag put: %s' % bag.name, *bag_files)
 
-    def bag_delete(self, bag): # XXX: prone to race condition due to separate Git operation
-        super(Store, self).bag_delete(bag)
+        with self._transaction('bag put: %s' % bag.name, *bag_files):
+            super(Store, self).bag_put(bag)
+            keepfile = bag_files[-1]
+            with file(keepfile, 'a'):
+                os.utime(keepfile, None) # `touch`
 
+    def bag_delete(self, bag):
         bag_path = self._bag_path(bag.name)
-        self._commit('bag delete: %s' % bag.name, *self._bag_files(bag_path))
+        prefix = '%s/' % os.path.relpath(bag_path, start=self._root)
+        tracked_files = [os.path.join(self._root, path) for path
+                in self.repo.open_index() if path.startswith(prefix)]
 
-    def recipe_put(self, recipe): # XXX: prone to race condition due to separate Git operation
-        super(Store, self).recipe_put(recipe)
+        with self._transaction('bag delete: %s' % bag.name, *tracked_files):
+            super(Store, self).bag_delete(bag)
 
-        recipe_filename = self._recipe_path(recipe)
-        self._commit('recipe put: %s' % recipe.name, recipe_filename)
+    def recipe_put(self, recipe):
+        try:
+            recipe_filename = self._recipe_path(recipe)
+        except StoreEncodingError, exc:
+            raise NoRecipeError(exc)
 
-    def recipe_delete(self, recipe): # XXX: prone to race condition due to separate Git operation
-        super(Store, self).recipe_delete(recipe)
+        self.serializer.object = recipe
+        with self._transaction('recipe put: %s' % recipe.name,
+                recipe_filename):
+            self._write_file(recipe_filename, self.serializer.to_string())
 
+    def recipe_delete(self, recipe):
         recipe_filename = self._recipe_path(recipe)
-        self._commit('recipe delete: %s' % recipe.name, recipe_filename)
-
-    def user_put(self, user): # XXX: prone to race condition due to separate Git operation
-        super(Store, self).user_put(user)
+        with self._transaction('recipe delete: %s' % recipe.name,
+                recipe_filename):
+            super(Store, self).recipe_delete(recipe)
 
+    def user_put(self, user):
         user_filename = self._user_path(user)
-        self._commit('user put: %s' % user.usersign, user_filename)
-
-    def user_delete(self, user): # XXX: prone to race condition due to separate Git operation
-        super(Store, self).user_delete(user)
-
+        user_dict = {
+            'usersign': user.usersign,
+            'note': user.note,
+            'password': user._password,
+            'roles': list(user.roles)
+        }
+        with self._transaction('user put: %s' % user.usersign, user_filename):
+            self._write_file(user_filename,
+                    simplejson.dumps(user_dict, indent=0))
+
+    def user_delete(self, user):
         user_filename = self._user_path(user)
-        self._commit('user delete: %s' % user.usersign, user_filename)
+        with self._transaction('user delete: %s' % user.usersign,
+                user_filename):
+            super(Store, self).user_delete(user)
 
     def search(self, search_query):
-        raise NotImplementedError
+        for bag_name, title in self._search.search(self.repo, search_query):
+            yield Tiddler(title, bag_name)
+
+    def recent_tiddlers(self, bag_name=None, limit=None):
+        """
+        generates up to `limit` tiddlers, optionally restricted to the given
+        bag, most recently modified first - based on the order of commits rather
+        than the tiddlers' `modified` attribute
+
+        tiddlers are not loaded, their revision denoting the latest commit
+        modifying them as of the current snapshot
+        """
+        try:
+            head = self._snapshot()
+        except KeyError: # no commits yet
+            return
+        entries = self._recent.recent(self.repo, bag_name, head)
+        for tiddler_bag, title, commit_id in islice(entries, limit):
+            tiddler = Tiddler(title, tiddler_bag)
+            tiddler.revision = commit_id[:10]
+            yield tiddler
+
+    def select_tiddlers(self, bag_name, attribute, value):
+        """
+        list tiddlers in the given bag by tag, field name or the value of a field
+        or attribute, as documented for `attributes.AttributeIndex.select`
+
+        the index reflects the latest commit, so selections are refused with
+        ValueError while a different snapshot is pinned or if writes are
+        committed asynchronously
+        """
+        if self._repository.writer:
+            raise ValueError('index does not include uncommitted writes')
+        titles = self._attributes.select(self.repo, bag_name, attribute, value)
+        pinned = self.environ.get(SNAPSHOT_KEY)
+        if pinned and pinned != self._attributes.head:
+            raise ValueError('index does not reflect pinned snapshot')
+        return [Tiddler(title, bag_name) for title in titles]
+
+    def tiddler_diff(self, tiddler, old_revision, new_revision=None):
+        """
+        compare two revisions of the given tiddler, the new one defaulting to the
+        latest revision
+
+        returns a dictionary describing the differences, as documented for
+        `diff.diff_tiddlers`, with `revisions` listing the old and new revision
+        """
+        relative_path = os.path.relpath(self._tiddler_base_filename(tiddler),
+                start=self._root)
+        if new_revision is None:
+            new_revision = self._current_revision(tiddler)
+
+        blob_ids = []
+        for revision in (old_revision, new_revision):
+            try:
+                blob_ids.append(self._revision_blob_id(revision, relative_path))
+            except KeyError, exc:
+                raise NoTiddlerError('no revision %s for %s: %s' %
+                        (revision, tiddler.title, exc))
+
+        key = tuple(blob_ids)
+        diff = DIFFS.get(key)
+        if diff is None:
+            old, new = [self._read_tiddler_blob(blob_id,
+                    Tiddler(tiddler.title, tiddler.bag)) for blob_id in blob_ids]
+            diff = diff_tiddlers(old, new)
+            DIFFS.add(key, diff)
+
+        diff = deepcopy(diff)
+        diff['revisions'] = [old_revision, new_revision]
+        return diff
+
+    def binary_digest(self, tiddler):
+        """
+        returns the SHA-1 hex digest of a binary tiddler's contents, as recorded
+        in its metadata, or None if unavailable
+
+        this is cheaper than reading the binary contents
+        """
+        metadata = Tiddler(tiddler.title, tiddler.bag)
+        try:
+            metadata = self._read_tiddler_file(metadata,
+                    self._tiddler_base_filename(tiddler))
+        except IOError, exc:
+            raise NoTiddlerError('no tiddler for "%s": %s' %
+                    (tiddler.title, exc))
+        match = BINCUE_PATTERN.match(metadata.text)
+        return match.group(1) if match else None
+
+    def verify_binary(self, tiddler):
+        """
+        checks whether a binary tiddler's contents match the digest recorded in
+        its metadata
+        """
+        digest = self.binary_digest(tiddler)
+        if digest is None: # legacy metadata
+            return False
+        return file_digest(self._binary_filename(tiddler)) == digest
+
+    def _current_revision(self, tiddler, head=None):
+        """
+        returns the tiddler's latest revision, disregarding commits made after
+        `head` if given
+        """
+        relative_path = os.path.relpath(self._tiddler_base_filename(tiddler),
+                start=self._root)
+        revision = self._revisions.latest(self.repo, relative_path, head)
+        return revision[:10] if revision else None
+
+    def tiddler_version(self, tiddler):
+        """
+        determine a tiddler's revision and blob ID as of the current snapshot,
+        without reading or parsing it - e.g. for validating ETags
+
+        raises NoTiddlerError if there is no such tiddler and ValueError if
+        writes are committed asynchronously, as reads might then include
+        uncommitted changes
+        """
+        if self._repository.writer:
+            raise ValueError('uncommitted writes are not versioned')
+        relative_path = self._relative_path(self._tiddler_base_filename(tiddler))
+        try:
+            snapshot = self._snapshot()
+            blob_id = self._blob_id(relative_path, snapshot)
+        except KeyError, exc:
+            raise NoTiddlerError('no tiddler for "%s": %s' %
+                    (tiddler.title, exc))
+        revision = self._revisions.latest(self.repo, relative_path, snapshot)
+        return revision[:10], blob_id
+
+    def policy_version(self, bag_name):
+        """
+        returns the blob ID of the given bag's policy as of the current snapshot
+
+        raises NoBagError if there is no such bag
+        """
+        policy_filename = os.path.join(self._bag_path(bag_name), 'policy')
+        try:
+            return self._blob_id(self._relative_path(policy_filename))
+        except KeyError, exc:
+            raise NoBagError('no policy for bag "%s": %s' % (bag_name, exc))
+
+    def _get_working_tiddler(self, tiddler, tiddler_filename):
+        """
+        retrieve a tiddler from the working tree, which might include changes
+        not committed yet - thus the revision might not match the contents
+        """
+        try:
+            tiddler = self._read_tiddler_file(tiddler, tiddler_filename)
+        except IOError, exc:
+            raise NoTiddlerError('no tiddler for "%s": %s' %
+                    (tiddler.title, exc))
+
+        tiddler.revision = self._current_revision(tiddler)
+
+        if binary_tiddler(tiddler):
+            binary_filename = self._binary_filename(tiddler)
+            if os.path.getsize(binary_filename) > self._stream_threshold:
+                tiddler.text = FileStream(binary_filename)
+            else:
+                with open(binary_filename, 'rb') as fh:
+                    tiddler.text = fh.read()
+
+        return tiddler
+
+    def _read_binary(self, tiddler, commit_id):
+        """
+        returns a binary tiddler's contents as of the given commit
+
+        large contents are streamed from the working tree, provided they match
+        the digest recorded as of that commit - otherwise, e.g. if they were
+        replaced since, the commit's blob is used
+        """
+        binary_filename = self._binary_filename(tiddler)
+        match = BINCUE_PATTERN.match(tiddler.text)
+        try:
+            size = os.path.getsize(binary_filename)
+        except OSError: # no working tree or removed since
+            size = 0
+        if match and size > self._stream_threshold:
+            stream = verified_stream(binary_filename, match.group(1))
+            if stream:
+                return stream
+
+        blob_id = self._blob_id(self._relative_path(binary_filename), commit_id)
+        return self.repo[blob_id].as_raw_string()
 
     def _get_tiddler_revision(self, tiddler, tiddler_filename):
         relative_path = os.path.relpath(tiddler_filename, start=self._root)
-        target = '%s:%s' % (tiddler.revision, relative_path)
         try:
-            tiddler_string = run('git', 'show', target, cwd=self._root) # TODO: should be handled via Dulwich
-        except subprocess.CalledProcessError, exc:
+            blob_id = self._revision_blob_id(tiddler.revision, relative_path)
+        except KeyError, exc:
             raise NoTiddlerError('no revision %s for %s: %s' %
                     (tiddler.revision, tiddler.title, exc))
 
-        revision_tiddler = Tiddler(tiddler.title, tiddler.bag)
-        self.serializer.object = revision_tiddler
-        self.serializer.from_string(tiddler_string)
+        revision_tiddler = self._read_tiddler_blob(blob_id,
+                Tiddler(tiddler.title, tiddler.bag))
         revision_tiddler.revision = tiddler.revision
         revision_tiddler.recipe = tiddler.recipe
         return revision_tiddler
 
-    def _commit(self, message, *filenames):
+    def _revision_blob_id(self, revision, relative_path):
         """
-        commit changes to given files
+        determine the ID of the blob at the given path as of the given revision
 
-        returns the new commit's hash
+        raises KeyError if there is no such blob
+        """
+        commit_id = self._resolve_revision(revision, relative_path)
+        tree = self.repo[self.repo[commit_id].tree]
+        _, blob_id = tree.lookup_path(self.repo.object_store.__getitem__,
+                relative_path)
+        return blob_id
+
+    def _read_tiddler_blob(self, blob_id, tiddler, tiddler_string=None):
+        """
+        populate tiddler from the given blob, parsing it only if not cached
+
+        `tiddler_string` optionally provides the blob's contents, avoiding a
+        lookup in the object store
+        """
+        if not TIDDLERS.get(blob_id, tiddler):
+            with timed('read'):
+                if tiddler_string is None:
+                    tiddler_string = self.repo[blob_id].as_raw_string()
+                self.serializer.object = tiddler
+                self.serializer.from_string(tiddler_string.decode('utf-8'))
+            TIDDLERS.add(blob_id, tiddler, len(tiddler_string))
+        return tiddler
+
+    def _read_tiddler_file(self, tiddler, tiddler_filename):
+        """
+        populate tiddler from the given file, parsing it only if its contents
+        are not cached - entries are keyed by blob ID, so they are shared with
+        reads from the object store
+        """
+        with timed('read'):
+            with open(tiddler_filename, 'rb') as fh:
+                tiddler_string = fh.read()
+        blob_id = Blob.from_string(tiddler_string).id
+        return self._read_tiddler_blob(blob_id, tiddler, tiddler_string)
+
+    def _serialize(self, tiddler):
+        with timed('serialize'):
+            return self.serializer.serialization.tiddler_as(tiddler)
+
+    def _resolve_commit(self, commit_id):
+        """
+        validate a full commit ID
+
+        raises ValueError if there is no such commit
+        """
+        commit_id = str(commit_id)
+        if (not re.match('^[0-9a-f]{40}$', commit_id) or
+                commit_id not in self.repo or
+                self.repo[commit_id].type_name != 'commit'):
+            raise ValueError('unknown commit: %s' % commit_id)
+        return commit_id
+
+    def _resolve_revision(self, revision, relative_path):
+        """
+        determine the full commit ID for an abbreviated revision of the given
+        path
+
+        raises KeyError if there is no such revision
+        """
+        revision = '%s' % revision
+        if len(revision) < 4: # mirror Git's minimum abbreviation length
+            raise KeyError(revision)
+        for commit_id in self._revisions.revisions(self.repo, relative_path):
+            if commit_id.startswith(revision):
+                return commit_id
+        if re.match('^[0-9a-f]{40}$', revision) and revision in self.repo:
+            return str(revision) # commit not touching the path
+        raise KeyError(revision)
+
+    @contextmanager
+    def _transaction(self, message, *filenames):
+        """
+        lock the given files and record the intended change in the journal
+        before any of them are modified, committing them once the block
+        completes - even if it fails, as files might have been modified already
+
+        the resulting commit's hash is available as `commit_id` on the yielded
+        object, which is None if the commit is deferred to the background
+        writer
+        """
+        author, committer = self._identities()
+        relative_paths = [os.path.relpath(filepath, start=self._root)
+                for filepath in filenames]
+        journal = self._repository.journal
+        with self._repository.path_locks(relative_paths):
+            entry = journal.append(message, author, committer, relative_paths)
+
+            transaction = _Transaction()
+            try:
+                yield transaction
+            except Exception:
+                # files might have been modified before the failure - as with
+                # recovery, their current state is committed, which is a no-op
+                # if nothing changed
+                exc_info = sys.exc_info()
+                try:
+                    self._commit(entry)
+                except Exception, exc: # remains pending in the journal
+                    LOGGER.exception('unable to commit changes of failed '
+                            'write: %s', exc)
+                raise exc_info[0], exc_info[1], exc_info[2]
+
+            if transaction.cancelled:
+                journal.complete([entry])
+            else:
+                transaction.commit_id = self._commit(entry)
+
+    def _commit(self, entry):
+        """
+        commit the changes described by the given journal entry
+
+        returns the new commit's hash or None if the commit is deferred to the
+        background writer
+        """
+        repository = self._repository
+        if repository.writer: # asynchronous mode
+            repository.writer.submit(entry)
+            return None
+
+        message, author, committer = [entry[key] for key
+                in ('message', 'author', 'committer')]
+        if repository.commit_group:
+            commit_id = repository.commit_group.commit(
+                    lambda changes: repository.commit(changes, committer),
+                    message, author, entry['paths'])
+        else:
+            commit_id = repository.commit([(message, author, entry['paths'])],
+                    committer)
+        repository.journal.complete([entry])
+        return commit_id
+
+    def _identities(self):
+        """
+        returns author and committer for the current request
         """
         host = self.environ['tiddlyweb.config']['server_host']
         host = '%s:%s' % (host['host'], host['port'])
@@ -237,12 +751,102 @@ class Store(TextStore):
         user = self.environ.get('tiddlyweb.usersign', {}).get('name', None)
         author = '%s <%s@%s>' % (user, user, host)
         committer = 'tiddlyweb <tiddlyweb@%s>' % host
+        return author, committer
+
+    def _write_file(self, filename, contents):
+        """
+        atomically replace the given file's contents
+        """
+        with timed('write'):
+            fd, tmp_filename = tempfile.mkstemp(dir=self.repo.controldir())
+            with os.fdopen(fd, 'w') as fh:
+                fh.write(contents.encode('utf-8'))
+            os.chmod(tmp_filename, 0644)
+            os.rename(tmp_filename, filename)
+
+    def _write_bag_description(self, desc, bag_path):
+        self._write_file(os.path.join(bag_path, 'description'), desc)
+
+    def _write_policy(self, policy, bag_path):
+        policy_dict = dict((key, getattr(policy, key))
+                for key in Policy.attributes)
+        self._write_file(os.path.join(bag_path, 'policy'),
+                simplejson.dumps(policy_dict))
+
+    def _snapshot(self):
+        """
+        returns the ID of the commit reads are served from, i.e. the pinned
+        snapshot, if any, or the latest commit
+
+        raises KeyError if there are no commits yet
+        """
+        return self.environ.get(SNAPSHOT_KEY) or self._head()
 
-        for filepath in filenames:
-            relpath = os.path.relpath(filepath, start=self._root)
-            self.repo.stage([relpath])
-        return self.repo.do_commit(message.encode("UTF-8"), author=author,
-                committer=committer)
+    def _head(self):
+        """
+        returns the ID of the latest commit, first committing any writes pending
+        in the background writer so they are reflected
+
+        raises KeyError if there are no commits yet
+        """
+        if self._repository.writer:
+            self._repository.writer.flush()
+        return self.repo.head()
+
+    def _tree_id(self, relative_path, commit_id=None):
+        """
+        determine the ID of the tree at the given path as of the given commit,
+        defaulting to the current snapshot
+
+        raises KeyError if there is no such tree
+        """
+        if commit_id is None:
+            commit_id = self._snapshot()
+        if not relative_path:
+            return self.repo[commit_id].tree
+        key = (commit_id, relative_path)
+        tree_id = TREES.get(key)
+        if tree_id is None:
+            tree = self.repo[self.repo[commit_id].tree]
+            mode, tree_id = tree.lookup_path(self.repo.object_store.__getitem__,
+                    relative_path)
+            if not stat.S_ISDIR(mode):
+                raise KeyError(relative_path)
+            TREES.add(key, tree_id)
+        return tree_id
+
+    def _blob_id(self, relative_path, commit_id=None):
+        """
+        determine the ID of the blob at the given path as of the given commit,
+        defaulting to the current snapshot
+
+        the parent directory's tree is parsed only once, so looking up multiple
+        files within the same directory does not get slower with its size
+
+        raises KeyError if there is no such blob
+        """
+        if commit_id is None:
+            commit_id = self._snapshot()
+        key = (commit_id, relative_path, 'blob')
+        blob_id = TREES.get(key)
+        if blob_id is None:
+            dirname, filename = posixpath.split(relative_path)
+            tree_id = self._tree_id(dirname, commit_id)
+            tree = PARSED_TREES.get(tree_id)
+            if tree is None:
+                tree = self.repo[tree_id]
+                PARSED_TREES.add(tree_id, tree)
+            mode, blob_id = tree[filename]
+            if stat.S_ISDIR(mode):
+                raise KeyError(relative_path)
+            TREES.add(key, blob_id)
+        return blob_id
+
+    def _relative_path(self, filename):
+        relative_path = os.path.relpath(filename, start=self._root)
+        if isinstance(relative_path, unicode):
+            relative_path = relative_path.encode('utf-8')
+        return relative_path
 
     def _bag_files(self, bag_path):
         bag_files = ['description', 'policy',
@@ -257,6 +861,28 @@ class Store(TextStore):
                 _encode_filename(tiddler.title))
 
 
+class _Transaction(object):
+
+    def __init__(self):
+        self.commit_id = None
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        discard the transaction without committing, e.g. for no-op writes
+        """
+        self.cancelled = True
+
+
+def _unchanged(current_tiddler, tiddler):
+    """
+    determine whether a tiddler's contents are identical to the stored version,
+    disregarding modification time
+    """
+    return all(getattr(current_tiddler, attr) == getattr(tiddler, attr)
+            for attr in ('modifier', 'tags', 'fields', 'type', 'text'))
+
+
 def run(cmd, *args, **kwargs):
     """
     execute a command, passing `args` to that command and using `kwargs` for
@@ -0,0 +1,95 @@
+"""
+persistent secondary indexes of tiddlers' tags, fields and selected attributes,
+allowing TiddlyWeb's `select` filters to load only matching tiddlers
+
+postings are kept per bag, listing the paths of tiddlers with a given tag, with
+a given field or with a given value for a field or attribute
+"""
+
+import os
+
+from hashlib import sha1
+
+from tiddlyweb.model.tiddler import Tiddler
+
+from .index import PostingsIndex, parse_tiddler_path
+from .stats import timed
+
+
+ATTRIBUTES = ['modifier', 'creator', 'type'] # indexed in addition to fields
+
+
+def indexable(attribute):
+    """
+    determine whether selections by the given attribute can be served by the
+    index, i.e. whether it refers to tags, field names, one of `ATTRIBUTES` or
+    a field's value
+    """
+    return (attribute in ('tag', 'field') or attribute in ATTRIBUTES or
+            not _reserved(attribute))
+
+
+class AttributeIndex(PostingsIndex):
+    """
+    maps tags, field names and values to the tiddlers carrying them
+    """
+
+    name = 'attributes'
+
+    def select(self, repo, bag_name, attribute, value):
+        """
+        returns the sorted titles of tiddlers in the given bag which carry tag
+        `value` (attribute "tag"), have a field named `value` (attribute
+        "field") or whose respective field or attribute equals `value`
+
+        raises ValueError if `attribute` is not indexed
+        """
+        if not indexable(attribute):
+            raise ValueError('attribute not indexed: %s' % attribute)
+        with timed('attributes'):
+            self.update(repo)
+            paths = self._postings(_key(bag_name, attribute, value))
+        return sorted(parse_tiddler_path(path)[1] for path in paths)
+
+    def _keys(self, tiddler):
+        return _tiddler_keys(tiddler)
+
+    def _postings_filename(self, key):
+        return os.path.join(self.index_dir, 'postings', key[:2], key[2:])
+
+
+def _tiddler_keys(tiddler):
+    """
+    returns the keys of all postings the given tiddler belongs to
+    """
+    keys = set(_key(tiddler.bag, 'tag', tag) for tag in tiddler.tags)
+    for name, value in tiddler.fields.items():
+        keys.add(_key(tiddler.bag, 'field', name))
+        if not _reserved(name):
+            keys.add(_key(tiddler.bag, name, value))
+    for attribute in ATTRIBUTES:
+        value = getattr(tiddler, attribute)
+        if value is not None:
+            keys.add(_key(tiddler.bag, attribute, value))
+    return keys
+
+
+def _key(bag_name, attribute, value):
+    """
+    returns a digest identifying the postings for the given selection
+
+    tags and field names are distinguished from field values by prefixing the
+    latter's attribute, thus avoiding collisions with fields named "tag" or
+    "field"
+    """
+    kind = attribute if attribute in ('tag', 'field') else 'value:%s' % attribute
+    key = u'\0'.join([bag_name, kind, value])
+    return sha1(key.encode('utf-8')).hexdigest()
+
+
+def _reserved(name):
+    """
+    determine whether `name` refers to a built-in tiddler attribute, thus
+    shadowing any field of that name in selections
+    """
+    return name in Tiddler.slots or name in ('tag', 'field', 'id', 'rbag')
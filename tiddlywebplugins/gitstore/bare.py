@@ -0,0 +1,397 @@
+"""
+bare-repository variant of the store
+
+entities are written directly into the object store and committed without a
+working tree or Git index, while reads are served from HEAD's tree - thus every
+write is only performed once
+
+    config = {
+        'server_store': ['tiddlywebplugins.gitstore.bare', {
+            'store_root': 'store.git'
+        }]
+    }
+
+commits are created synchronously and atomically, so there is no need for the
+journal: `durability` must be "sync" and `group_commit` does not apply
+"""
+
+import os
+import tempfile
+
+from hashlib import sha1
+from contextlib import contextmanager
+
+import simplejson
+
+from dulwich.repo import Repo
+from dulwich.objects import Blob
+
+from tiddlyweb.model.policy import Policy
+from tiddlyweb.model.tiddler import Tiddler
+from tiddlyweb.serializer import TiddlerFormatError
+from tiddlyweb.store import (NoBagError, NoRecipeError, NoTiddlerError,
+        NoUserError, StoreEncodingError)
+from tiddlyweb.stores.text import _encode_filename
+from tiddlyweb.util import binary_tiddler
+
+from . import Store as GitStore, BINCUE, _unchanged
+from .streams import write_stream, add_blob_from_file
+from .stats import timed
+
+
+FILE_MODE = 0100644
+
+
+class Store(GitStore):
+
+    def list_tiddler_revisions(self, tiddler):
+        tiddler_filename = self._tiddler_base_filename(tiddler)
+        if not self._exists(tiddler_filename):
+            raise NoTiddlerError('unable to list revisions for tiddler "%s"'
+                    % tiddler.title)
+
+        relative_path = self._relative_path(tiddler_filename)
+        revisions = self._revisions.revisions(self.repo, relative_path)
+
+        return [rev[:10] for rev in revisions]
+
+    def tiddler_put(self, tiddler):
+        msg = 'tiddler put: %s/%s' % (tiddler.bag, tiddler.title)
+        self._put_tiddlers([tiddler], msg)
+
+    def put_tiddlers(self, tiddlers):
+        """
+        write multiple tiddlers, committing them all at once
+
+        this is intended for bulk imports and bypasses the respective hooks of
+        TiddlyWeb's store wrapper
+
+        returns the list of tiddlers, all changed ones having the same revision
+        """
+        tiddlers = list(tiddlers)
+        if not tiddlers:
+            return tiddlers
+
+        bags = sorted(set(tiddler.bag for tiddler in tiddlers))
+        msg = 'tiddlers put: %s tiddlers in %s' % (len(tiddlers),
+                ', '.join(bags))
+        self._put_tiddlers(tiddlers, msg)
+        return tiddlers
+
+    def tiddler_delete(self, tiddler):
+        tiddler_filename = self._tiddler_base_filename(tiddler)
+        binary_filename = self._binary_filename(tiddler)
+
+        msg = 'tiddler delete: %s/%s' % (tiddler.bag, tiddler.title)
+        with self._locked(tiddler_filename, binary_filename):
+            if not self._exists(tiddler_filename):
+                raise NoTiddlerError('%s not present' % tiddler_filename)
+            removals = dict((filename, None) for filename
+                    in (tiddler_filename, binary_filename)
+                    if self._exists(filename))
+            self._put_files(msg, removals)
+
+    def bag_put(self, bag):
+        bag_path = self._bag_path(bag.name)
+        description, policy, keepfile = self._bag_files(bag_path)
+        policy_dict = dict((key, getattr(bag.policy, key))
+                for key in Policy.attributes)
+
+        self._put_files('bag put: %s' % bag.name, {
+            description: bag.desc,
+            policy: simplejson.dumps(policy_dict),
+            keepfile: ''
+        })
+
+    def bag_delete(self, bag):
+        bag_path = self._bag_path(bag.name)
+        with self._locked(bag_path):
+            try:
+                self._tree_id(self._relative_path(bag_path))
+            except KeyError:
+                raise NoBagError('%s not present' % bag_path)
+            self._put_files('bag delete: %s' % bag.name, { bag_path: None })
+
+    def recipe_get(self, recipe):
+        try:
+            recipe_string = self._read_file(self._recipe_path(recipe))
+        except (IOError, StoreEncodingError), exc:
+            raise NoRecipeError('unable to get recipe %s: %s' %
+                    (recipe.name, exc))
+
+        self.serializer.object = recipe
+        return self.serializer.from_string(recipe_string.decode('utf-8'))
+
+    def recipe_put(self, recipe):
+        try:
+            recipe_filename = self._recipe_path(recipe)
+        except StoreEncodingError, exc:
+            raise NoRecipeError(exc)
+
+        self.serializer.object = recipe
+        self._put_files('recipe put: %s' % recipe.name,
+                { recipe_filename: self.serializer.to_string() })
+
+    def recipe_delete(self, recipe):
+        try:
+            recipe_filename = self._recipe_path(recipe)
+        except StoreEncodingError, exc:
+            raise NoRecipeError(exc)
+
+        with self._locked(recipe_filename):
+            if not self._exists(recipe_filename):
+                raise NoRecipeError('%s not present' % recipe_filename)
+            self._put_files('recipe delete: %s' % recipe.name,
+                    { recipe_filename: None })
+
+    def user_get(self, user):
+        try:
+            user_info = self._read_file(self._user_path(user))
+        except IOError, exc:
+            raise NoUserError('unable to get user %s: %s' %
+                    (user.usersign, exc))
+
+        for key, value in simplejson.loads(user_info.decode('utf-8')).items():
+            if key == 'roles':
+                user.roles = set(value)
+                continue
+            if key == 'password':
+                key = '_password'
+            setattr(user, key, value)
+        return user
+
+    def user_put(self, user):
+        user_dict = {
+            'usersign': user.usersign,
+            'note': user.note,
+            'password': user._password,
+            'roles': list(user.roles)
+        }
+        self._put_files('user put: %s' % user.usersign,
+                { self._user_path(user): simplejson.dumps(user_dict, indent=0) })
+
+    def user_delete(self, user):
+        user_filename = self._user_path(user)
+        with self._locked(user_filename):
+            if not self._exists(user_filename):
+                raise NoUserError('%s not present' % user_filename)
+            self._put_files('user delete: %s' % user.usersign,
+                    { user_filename: None })
+
+    def verify_binary(self, tiddler):
+        """
+        checks whether a binary tiddler's contents match the digest recorded in
+        its metadata
+        """
+        digest = self.binary_digest(tiddler)
+        if digest is None: # legacy metadata
+            return False
+        try:
+            contents = self._read_file(self._binary_filename(tiddler))
+        except IOError:
+            return False
+        return sha1(contents).hexdigest() == digest
+
+    def _init_store(self):
+        """
+        create the bare repository if necessary
+        """
+        if os.path.exists(os.path.join(self._root, 'HEAD')):
+            return
+        if not os.path.isdir(self._root):
+            os.makedirs(self._root)
+        Repo.init_bare(self._root)
+
+    def _put_tiddlers(self, tiddlers, message):
+        """
+        commit the given tiddlers, skipping unchanged binary tiddlers
+        """
+        filenames = [filename for tiddler in tiddlers
+                for filename in self._tiddler_files(tiddler)]
+
+        changes = []
+        changed = []
+        with self._locked(*filenames):
+            for tiddler in tiddlers:
+                tiddler_changes = self._tiddler_changes(tiddler)
+                if tiddler_changes:
+                    changes.extend(tiddler_changes)
+                    changed.append(tiddler)
+                else: # no-op
+                    tiddler.revision = self._current_revision(tiddler)
+            if changes:
+                commit_id = self._commit_changes(message, changes)
+
+        for tiddler in changed:
+            tiddler.revision = self._current_revision(tiddler, commit_id)
+
+    def _tiddler_changes(self, tiddler):
+        """
+        add the given tiddler's contents to the object store
+
+        returns the respective tree changes, which are empty if the tiddler is
+        unchanged
+        """
+        tiddler_filename = self._tiddler_base_filename(tiddler)
+        if tiddler_filename == self._binaries_dir(tiddler.bag):
+            raise TiddlerFormatError("reserved tiddler title")
+
+        # Protect against incoming tiddlers that have revision set. Since we are
+        # putting a new one, we want the system to calculate.
+        tiddler.revision = None
+
+        # store original creator and created
+        try:
+            current_rev = Tiddler(tiddler.title, tiddler.bag)
+            current_rev = self._read_tiddler_file(current_rev, tiddler_filename)
+            tiddler.creator = current_rev.creator
+            tiddler.created = current_rev.created
+        except IOError: # first revision
+            current_rev = None
+            tiddler.creator = tiddler.modifier
+            tiddler.created = tiddler.modified
+
+        if not binary_tiddler(tiddler):
+            blob_id = self._add_blob(self._serialize(tiddler))
+            return [(self._relative_path(tiddler_filename), FILE_MODE, blob_id)]
+
+        binary_data = tiddler.text
+        digest, binary_id = self._add_binary(binary_data)
+        # see `GitStore._write_tiddler`
+        tiddler.text = BINCUE % digest
+        try:
+            if current_rev and _unchanged(current_rev, tiddler):
+                return []
+            blob_id = self._add_blob(self._serialize(tiddler))
+        finally:
+            tiddler.text = binary_data # restore original
+
+        binary_filename = self._binary_filename(tiddler)
+        return [(self._relative_path(tiddler_filename), FILE_MODE, blob_id),
+                (self._relative_path(binary_filename), FILE_MODE, binary_id)]
+
+    def _put_files(self, message, files):
+        """
+        commit the given files' contents (None for removals)
+
+        returns the new commit's hash
+        """
+        changes = []
+        for filename, contents in files.items():
+            path = self._relative_path(filename)
+            if contents is None:
+                changes.append((path, None, None))
+            else:
+                changes.append((path, FILE_MODE, self._add_blob(contents)))
+        return self._commit_changes(message, changes)
+
+    def _commit_changes(self, message, changes):
+        author, committer = self._identities()
+        return self._repository.commit_objects(message, author, committer,
+                changes)
+
+    def _add_blob(self, contents):
+        """
+        add the given contents to the object store, returning the blob's ID
+        """
+        if isinstance(contents, unicode):
+            contents = contents.encode('utf-8')
+        blob = Blob.from_string(contents)
+        with timed('write'):
+            self.repo.object_store.add_object(blob)
+        return blob.id
+
+    def _add_binary(self, data):
+        """
+        add binary contents, either a string or a file-like object, to the
+        object store
+
+        returns the contents' SHA-1 hex digest along with the blob's ID
+        """
+        if not hasattr(data, 'read'):
+            return sha1(data).hexdigest(), self._add_blob(data)
+
+        # streams are buffered on disk as the blob header requires their size
+        fd, tmp_filename = tempfile.mkstemp(dir=self.repo.controldir())
+        os.close(fd)
+        try:
+            with timed('write'):
+                digest = write_stream(tmp_filename, data)
+            blob_id = add_blob_from_file(self.repo.object_store, tmp_filename,
+                    os.path.getsize(tmp_filename))
+        finally:
+            os.remove(tmp_filename)
+        return digest, blob_id
+
+    @contextmanager
+    def _locked(self, *filenames):
+        """
+        lock the given files, reading from the latest commit rather than any
+        pinned snapshot while they are held
+        """
+        with self._repository.path_locks([self._relative_path(filename)
+                for filename in filenames]):
+            with self.snapshot():
+                yield
+
+    def _read_file(self, filename):
+        """
+        returns the contents of the given file as of the current snapshot
+
+        raises IOError if there is no such file
+        """
+        try:
+            blob_id = self._blob_id(self._relative_path(filename))
+        except KeyError:
+            raise IOError('no such file: %s' % filename)
+        return self.repo[blob_id].as_raw_string()
+
+    def _read_tiddler_file(self, tiddler, tiddler_filename):
+        try:
+            blob_id = self._blob_id(self._relative_path(tiddler_filename))
+        except KeyError:
+            raise IOError('no such file: %s' % tiddler_filename)
+        return self._read_tiddler_blob(blob_id, tiddler)
+
+    def _read_bag_description(self, bag_path):
+        try:
+            desc = self._read_file(os.path.join(bag_path, 'description'))
+        except IOError:
+            return ''
+        return desc.decode('utf-8')
+
+    def _read_policy(self, bag_path):
+        policy_data = self._read_file(os.path.join(bag_path, 'policy'))
+        policy = Policy()
+        for key, value in simplejson.loads(policy_data.decode('utf-8')).items():
+            setattr(policy, key, value)
+        return policy
+
+    def _files_in_dir(self, path):
+        """
+        list the entries of the given directory as of the current snapshot
+        """
+        try:
+            tree_id = self._tree_id(self._relative_path(path))
+        except KeyError: # no such directory or no commits yet
+            return iter([])
+        return iter(self.repo[tree_id])
+
+    def _tiddler_base_filename(self, tiddler):
+        store_dir = self._tiddlers_dir(tiddler.bag)
+        try:
+            self._tree_id(self._relative_path(store_dir))
+        except KeyError:
+            raise NoBagError('%s does not exist' % store_dir)
+
+        try:
+            return os.path.join(store_dir, _encode_filename(tiddler.title))
+        except StoreEncodingError, exc:
+            raise NoTiddlerError(exc)
+
+    def _exists(self, filename):
+        try:
+            self._blob_id(self._relative_path(filename))
+        except KeyError:
+            return False
+        return True
@@ -0,0 +1,90 @@
+"""
+process-wide caches of data derived from Git objects, e.g. parsed tiddlers keyed
+by blob ID
+
+since objects are content-addressed, cached entries never need to be invalidated
+"""
+
+from copy import deepcopy
+from threading import Lock
+
+from dulwich.lru_cache import LRUCache, LRUSizeCache
+
+
+CACHE_SIZE = 16 * 1024 * 1024 # bytes
+
+_ATTRIBUTES = ['creator', 'created', 'modifier', 'modified', 'tags', 'fields',
+        'type', 'text']
+
+
+class TiddlerCache(object):
+    """
+    thread-safe, size-bounded LRU cache of tiddler contents
+
+    entries are copied on the way in and out so cached data cannot be modified
+    by callers
+    """
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self._cache = LRUSizeCache(max_size, compute_size=lambda entry: entry[0])
+        self._lock = Lock()
+
+    def get(self, blob_id, tiddler):
+        """
+        populates `tiddler` from the cache entry for `blob_id`
+
+        returns the tiddler or None if there is no such entry
+        """
+        with self._lock:
+            entry = self._cache.get(blob_id)
+        if entry is None:
+            return None
+
+        for attr, value in entry[1].items():
+            setattr(tiddler, attr, deepcopy(value))
+        return tiddler
+
+    def add(self, blob_id, tiddler, size):
+        """
+        caches the contents of `tiddler` for `blob_id`, `size` being the length
+        of the respective serialization
+        """
+        data = dict((attr, deepcopy(getattr(tiddler, attr)))
+                for attr in _ATTRIBUTES)
+        with self._lock:
+            self._cache.add(blob_id, (size, data))
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+class ObjectCache(object):
+    """
+    thread-safe LRU cache of data derived from immutable Git objects, e.g. the
+    tiddler titles within a given tree
+    """
+
+    def __init__(self, max_entries=1000):
+        self._cache = LRUCache(max_entries)
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._cache.get(key, default)
+
+    def add(self, key, value):
+        with self._lock:
+            self._cache.add(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+TIDDLERS = TiddlerCache()
+LISTINGS = ObjectCache() # tree ID -> titles
+DIFFS = ObjectCache() # (old blob ID, new blob ID) -> diff
+TREES = ObjectCache(10000) # (commit ID, path[, 'blob']) -> tree or blob ID
+PARSED_TREES = ObjectCache(32) # tree ID -> tree, not to be modified
+ETAGS = ObjectCache(10000) # (request details, ETag) -> validation details
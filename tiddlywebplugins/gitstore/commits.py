@@ -0,0 +1,91 @@
+"""
+group commit: coalescing concurrent writes into a single Git commit
+
+the first writer to arrive becomes the group's leader; it waits for the
+configured window (or until enough files are pending), then commits on behalf
+of every writer in the group while the next group starts accumulating
+"""
+
+import time
+
+from threading import Condition, Lock
+
+
+class CommitGroup(object):
+    """
+    coordinates writers so that changes arriving within `window` seconds (up to
+    `max_files` files) are committed together
+    """
+
+    def __init__(self, window=0.05, max_files=100):
+        self.window = window
+        self.max_files = max_files
+        self._pending = []
+        self._leader = False
+        self._condition = Condition()
+        self._commit_lock = Lock()
+
+    def commit(self, committer, message, author, filenames):
+        """
+        commit `filenames` as part of the next group, returning the ID of the
+        commit which includes them
+
+        `committer` is a function which is passed a list of (message, author,
+        filenames) tuples and returns the resulting commit's ID
+        """
+        change = _Change(message, author, filenames)
+        with self._condition:
+            self._pending.append(change)
+            if self._leader:
+                self._condition.notify_all()
+                while not change.done:
+                    self._condition.wait()
+                return change.result()
+            self._leader = True
+
+            deadline = time.time() + self.window
+            while self._pending_files() < self.max_files:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            group = self._pending
+            self._pending = []
+            self._leader = False # allow the next group to form
+
+        with self._commit_lock:
+            try:
+                commit_id = committer([(member.message, member.author,
+                        member.filenames) for member in group])
+                error = None
+            except Exception, exc:
+                commit_id = None
+                error = exc
+
+        with self._condition:
+            for member in group:
+                member.commit_id = commit_id
+                member.error = error
+                member.done = True
+            self._condition.notify_all()
+        return change.result()
+
+    def _pending_files(self):
+        return sum(len(member.filenames) for member in self._pending)
+
+
+class _Change(object):
+
+    def __init__(self, message, author, filenames):
+        self.message = message
+        self.author = author
+        self.filenames = filenames
+        self.commit_id = None
+        self.error = None
+        self.done = False
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.commit_id
@@ -0,0 +1,61 @@
+"""
+comparison of tiddler revisions
+"""
+
+from difflib import unified_diff
+
+from tiddlyweb.util import binary_tiddler
+
+
+ATTRIBUTES = ['modifier', 'modified', 'type']
+
+
+def diff_tiddlers(old, new, context=3):
+    """
+    compare two revisions of a tiddler
+
+    returns a dictionary with the following members:
+    * `attributes`: maps changed attributes (modifier, modified, type) to a
+      list of old and new value
+    * `tags`: lists of `added` and `removed` tags
+    * `fields`: `added` and `removed` fields as well as `changed` ones, mapped
+      to a list of old and new value
+    * `text`: unified diff of the text with `context` lines of context, None
+      if unchanged or binary
+    * `binary`: whether either revision is binary
+    * `text_changed`: whether the text (or binary contents) differs
+    """
+    old_fields = old.fields
+    new_fields = new.fields
+    binary = binary_tiddler(old) or binary_tiddler(new)
+    text_changed = old.text != new.text
+
+    text = None
+    if text_changed and not binary:
+        lines = list(unified_diff(old.text.splitlines(),
+                new.text.splitlines(), n=context, lineterm=''))
+        if lines: # difflib's headers do not support non-ASCII file names
+            lines[:2] = [u'--- a/%s' % old.title, u'+++ b/%s' % new.title]
+        text = '\n'.join(lines)
+
+    return {
+        'attributes': dict((attr, [getattr(old, attr), getattr(new, attr)])
+                for attr in ATTRIBUTES
+                if getattr(old, attr) != getattr(new, attr)),
+        'tags': {
+            'added': [tag for tag in new.tags if tag not in old.tags],
+            'removed': [tag for tag in old.tags if tag not in new.tags]
+        },
+        'fields': {
+            'added': dict((key, value) for key, value in new_fields.items()
+                    if key not in old_fields),
+            'removed': dict((key, value) for key, value in old_fields.items()
+                    if key not in new_fields),
+            'changed': dict((key, [old_fields[key], value]) for key, value
+                    in new_fields.items()
+                    if key in old_fields and old_fields[key] != value)
+        },
+        'text': text,
+        'binary': bool(binary),
+        'text_changed': text_changed
+    }
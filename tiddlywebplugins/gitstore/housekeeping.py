@@ -0,0 +1,254 @@
+"""
+automatic repacking of the object store
+
+every commit adds loose objects; once there are too many of them (estimated the
+same way as `git gc --auto` does, by sampling a single fan-out directory), they
+are combined into a pack in a background thread - likewise, once there are too
+many packs, these are consolidated into a single one
+
+objects are streamed into the new pack one at a time, and only removed from
+their original location once that pack is in place - packs are consolidated
+through a separate object store, so the packs being read by request threads are
+never closed underneath them; the shared `SharedObjectStore` picks up the
+changes when refreshing its cache
+"""
+
+import os
+import errno
+import logging
+import tempfile
+
+from hashlib import sha1
+from threading import Thread, Lock, RLock
+
+from dulwich.object_store import DiskObjectStore
+from dulwich.pack import write_pack_header, write_pack_object
+
+from .locks import FileLock, LockTimeout
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+LOOSE_LIMIT = 6700 # mirrors Git's `gc.auto`
+PACK_LIMIT = 50 # mirrors Git's `gc.autoPackLimit`
+
+
+class Housekeeper(object):
+    """
+    monitors the given repository's object store, repacking it in the
+    background if necessary
+
+    `lock_filename` serializes housekeeping across processes
+    """
+
+    def __init__(self, repo, lock_filename, loose_limit=LOOSE_LIMIT,
+            pack_limit=PACK_LIMIT):
+        self.repo = repo
+        self.lock_filename = lock_filename
+        self.loose_limit = loose_limit
+        self.pack_limit = pack_limit
+        self._lock = Lock()
+        self._thread = None
+
+    def notify(self):
+        """
+        check whether housekeeping is required, starting a background thread if
+        so
+
+        this is cheap enough to be invoked after every commit
+        """
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            if not self.required():
+                return
+            self._thread = Thread(target=self._run,
+                    name='gitstore housekeeping')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def join(self):
+        """
+        block until any ongoing housekeeping has finished
+        """
+        thread = self._thread
+        if thread:
+            thread.join()
+
+    def required(self):
+        return (self.loose_objects() > self.loose_limit or
+                self.pack_count() > self.pack_limit)
+
+    def loose_objects(self):
+        """
+        returns the estimated number of loose objects
+        """
+        # objects are evenly distributed across the 256 fan-out directories
+        try:
+            sample = os.listdir(os.path.join(self.repo.object_store.path,
+                    '17'))
+        except OSError: # no such directory
+            return 0
+        return len(sample) * 256
+
+    def pack_count(self):
+        try:
+            return len([filename for filename
+                    in os.listdir(self.repo.object_store.pack_dir)
+                    if filename.endswith('.pack')])
+        except OSError: # no such directory
+            return 0
+
+    def run(self):
+        """
+        pack loose objects and consolidate packs if necessary
+
+        returns the number of objects packed, or None if housekeeping is already
+        in progress in another process
+        """
+        try:
+            with FileLock(self.lock_filename, 0, 'housekeeping'):
+                packed = pack_loose_objects(self.repo.object_store)
+                if self.pack_count() > self.pack_limit:
+                    packed += consolidate_packs(self.repo.object_store)
+                return packed
+        except LockTimeout: # another process is already housekeeping
+            return None
+
+    def _run(self):
+        try:
+            packed = self.run()
+            LOGGER.debug('housekeeping packed %s objects', packed)
+        except Exception, exc:
+            LOGGER.exception('housekeeping failed: %s', exc)
+
+
+class SharedObjectStore(DiskObjectStore):
+    """
+    object store which can be shared between threads
+
+    dulwich reads each pack through a single file object, so access to packs is
+    serialized - this also means that packs removed by housekeeping are only
+    closed while no other thread is reading them
+    """
+
+    def __init__(self, *args, **kwargs):
+        DiskObjectStore.__init__(self, *args, **kwargs)
+        self._pack_lock = RLock()
+
+    def get_raw(self, name):
+        with self._pack_lock:
+            try:
+                return DiskObjectStore.get_raw(self, name)
+            except EnvironmentError, exc:
+                if exc.errno != errno.ENOENT:
+                    raise
+                # a pack was removed by housekeeping before being opened
+                self._update_pack_cache()
+                return DiskObjectStore.get_raw(self, name)
+
+    def contains_packed(self, sha):
+        with self._pack_lock:
+            try:
+                return DiskObjectStore.contains_packed(self, sha)
+            except EnvironmentError, exc:
+                if exc.errno != errno.ENOENT:
+                    raise
+                self._update_pack_cache()
+                return DiskObjectStore.contains_packed(self, sha)
+
+    def _add_cached_pack(self, base_name, pack):
+        with self._pack_lock:
+            DiskObjectStore._add_cached_pack(self, base_name, pack)
+
+    def _update_pack_cache(self):
+        with self._pack_lock:
+            return DiskObjectStore._update_pack_cache(self)
+
+
+def pack_loose_objects(object_store):
+    """
+    combine all loose objects into a new pack
+
+    returns the number of objects packed
+    """
+    object_ids = list(object_store._iter_loose_objects())
+    if not object_ids:
+        return 0
+
+    # objects pruned concurrently are skipped, so the number of objects in the
+    # pack, and thus its header and checksum, are only known afterwards
+    fd, filename = tempfile.mkstemp(dir=object_store.pack_dir, suffix='.pack')
+    packed = []
+    try:
+        with os.fdopen(fd, 'w+b') as fh:
+            write_pack_header(fh, 0)
+            for object_id in object_ids:
+                obj = object_store._get_loose_object(object_id)
+                if obj is None:
+                    continue
+                write_pack_object(fh, obj.type_num, obj.as_raw_string(),
+                        compression_level=object_store.pack_compression_level)
+                packed.append(object_id)
+            fh.seek(0)
+            write_pack_header(fh, len(packed))
+            fh.seek(0)
+            checksum = sha1()
+            for chunk in iter(lambda: fh.read(64 * 1024), ''):
+                checksum.update(chunk)
+            fh.write(checksum.digest())
+            fh.flush()
+            os.fsync(fh.fileno())
+        if packed:
+            object_store.move_in_pack(filename)
+    finally:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    for object_id in packed:
+        try:
+            object_store._remove_loose_object(object_id)
+        except OSError, exc: # removed concurrently
+            if exc.errno != errno.ENOENT:
+                raise
+    return len(packed)
+
+
+def consolidate_packs(object_store):
+    """
+    combine all existing packs into a single one
+
+    returns the number of objects packed
+    """
+    # a separate object store is used so packs cached by `object_store` remain
+    # open for concurrent readers
+    private_store = DiskObjectStore(object_store.path,
+            pack_compression_level=object_store.pack_compression_level)
+    try:
+        packs = private_store.packs
+        if len(packs) < 2: # nothing to consolidate
+            return 0
+        object_ids = set(object_id for pack in packs for object_id in pack)
+
+        def records():
+            seen = set()
+            for pack in packs:
+                for obj in pack.iterobjects():
+                    if obj.id not in seen:
+                        seen.add(obj.id)
+                        yield (obj.type_num, obj.sha().digest(), None,
+                                obj.as_raw_string())
+
+        consolidated = private_store.add_pack_data(len(object_ids), records())
+        for pack in packs:
+            if pack.name() != consolidated.name():
+                try:
+                    private_store._remove_pack(pack)
+                except OSError, exc: # removed concurrently
+                    if exc.errno != errno.ENOENT:
+                        raise
+    finally:
+        private_store.close()
+    object_store._update_pack_cache()
+    return len(object_ids)
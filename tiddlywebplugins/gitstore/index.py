@@ -0,0 +1,311 @@
+"""
+infrastructure for persistent indexes derived from the repository's history
+
+indexes live inside the repository's control directory, each in its own
+directory containing a marker which records the most recently indexed commit
+"""
+
+import os
+import urllib
+
+from hashlib import sha1
+from threading import Lock
+
+from dulwich.diff_tree import tree_changes
+
+from tiddlyweb.model.tiddler import Tiddler
+from tiddlyweb.serializer import Serializer
+
+from .locks import FileLock
+
+
+class Index(object):
+    """
+    base class for indexes which are brought up to date lazily, only ever
+    examining commits which have not been indexed yet
+
+    subclasses are expected to provide a `name` and implement `_update`, and
+    may implement `_advance` to index new commits without comparing trees
+    """
+
+    name = None
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.head = None
+        self._lock = Lock()
+
+    def update(self, repo):
+        """
+        incorporate any commits added to the repository since the last update
+        """
+        try:
+            head = repo.head()
+        except KeyError: # no commits yet
+            return
+
+        if head == self.head:
+            return
+
+        with self._lock:
+            with self._file_lock():
+                indexed = self._read_marker()
+                if indexed != head:
+                    self._update(repo, indexed, head)
+                    self._write_marker(head)
+                self.head = head
+
+    def advance(self, repo, parent, head, changes):
+        """
+        incorporate commit `head`, made on top of `parent` (None for the first
+        commit), given its changes as (path, old blob ID, new blob ID) tuples,
+        blob IDs being None for absent files
+
+        this avoids comparing the commits' trees, falling back to `update` if
+        the index does not reflect `parent`
+        """
+        with self._lock:
+            with self._file_lock():
+                if self._read_marker() == parent:
+                    self._advance(repo, parent, head, changes)
+                    self._write_marker(head)
+                    self.head = head
+                    return
+        self.update(repo)
+
+    def rebuild(self, repo):
+        """
+        discard the existing index and recreate it from the repository
+        """
+        with self._lock:
+            with self._file_lock():
+                self.head = None
+                self._clear()
+                try:
+                    head = repo.head()
+                except KeyError: # no commits yet
+                    head = None
+                if head:
+                    self._update(repo, None, head)
+                self._write_marker(head)
+                self.head = head
+
+    def _update(self, repo, indexed, head):
+        """
+        index commits between `indexed` (None if the index is empty) and `head`
+        """
+        raise NotImplementedError
+
+    def _advance(self, repo, parent, head, changes):
+        """
+        index commit `head` based on its changes relative to `parent`
+        """
+        self._update(repo, parent, head)
+
+    def _new_commits(self, repo, indexed, head):
+        """
+        returns walker entries for the commits between `indexed` (None if the
+        index is empty) and `head`, oldest first
+
+        if `head` does not descend from `indexed`, the index is cleared and all
+        commits are returned
+        """
+        if indexed:
+            if head == indexed:
+                return []
+            entries = list(repo.get_walker(include=[head], exclude=[indexed]))
+            if entries and indexed in entries[-1].commit.parents:
+                entries.reverse()
+                return entries
+            # history does not descend from the indexed commit (e.g. after a
+            # reset to one of its ancestors)
+            self._clear()
+        return repo.get_walker(include=[head], reverse=True)
+
+    def _clear(self):
+        for dirpath, dirnames, filenames in os.walk(self.index_dir):
+            if dirpath == self.index_dir:
+                continue
+            for filename in filenames:
+                os.remove(os.path.join(dirpath, filename))
+
+    def _read_lines(self, filename):
+        try:
+            with open(filename) as fh:
+                return fh.read().splitlines()
+        except IOError: # no entries
+            return []
+
+    def _write_lines(self, filename, lines, mode='w'):
+        """
+        write lines to file, appending if `mode` is "a" and atomically
+        replacing the file's contents otherwise
+        """
+        try:
+            os.makedirs(os.path.dirname(filename))
+        except OSError: # already exists
+            pass
+        contents = ''.join('%s\n' % line for line in lines)
+        if mode == 'a':
+            with open(filename, 'a') as fh:
+                fh.write(contents)
+        else:
+            with open(filename + '.tmp', 'w') as fh:
+                fh.write(contents)
+            os.rename(filename + '.tmp', filename)
+
+    def _read_marker(self):
+        try:
+            with open(os.path.join(self.index_dir, 'HEAD')) as fh:
+                return fh.read().strip() or None
+        except IOError: # not indexed yet
+            return None
+
+    def _write_marker(self, head):
+        marker = os.path.join(self.index_dir, 'HEAD')
+        with open(marker + '.tmp', 'w') as fh:
+            fh.write(head or '')
+        os.rename(marker + '.tmp', marker)
+
+    def _file_lock(self):
+        try:
+            os.makedirs(self.index_dir)
+        except OSError: # already exists
+            pass
+        return FileLock(os.path.join(self.index_dir, 'lock'), kind='index')
+
+    def _key_filename(self, category, key):
+        """
+        returns the name of the file holding entries for the given key
+        """
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        digest = sha1(key).hexdigest()
+        return os.path.join(self.index_dir, category, digest[:2], digest[2:])
+
+
+class PostingsIndex(Index):
+    """
+    base class for indexes mapping keys derived from tiddlers' contents to
+    postings, listing the paths of tiddlers with the respective key
+
+    each tiddler's own keys are recorded so that outdated postings can be
+    removed when it changes
+
+    subclasses are expected to implement `_keys` and `_postings_filename`
+    """
+
+    def _postings(self, key):
+        """
+        returns the paths of tiddlers with the given key
+        """
+        return self._read_lines(self._postings_filename(key))
+
+    def _keys(self, tiddler):
+        """
+        returns the set of keys for the given tiddler
+        """
+        raise NotImplementedError
+
+    def _postings_filename(self, key):
+        """
+        returns the name of the file holding the postings for the given key
+        """
+        raise NotImplementedError
+
+    def _update(self, repo, indexed, head):
+        self._apply(repo, tiddler_changes(repo, indexed, head), bool(indexed))
+
+    def _advance(self, repo, parent, head, changes):
+        self._apply(repo, [change for change in changes
+                if parse_tiddler_path(change[0]) is not None], bool(parent))
+
+    def _apply(self, repo, changes, indexed):
+        """
+        update entries for the given tiddler changes, as generated by
+        `tiddler_changes` - `indexed` is False if the index is empty
+        """
+        additions = {}
+        removals = {}
+        for path, old_id, new_id in changes:
+            document = self._key_filename('documents', path)
+            old_keys = set(self._read_lines(document)) if indexed else set()
+            if new_id:
+                new_keys = self._keys(read_tiddler_blob(repo, path, new_id))
+                self._write_lines(document, sorted(new_keys))
+            else:
+                new_keys = set()
+                self._write_lines(document, [])
+            for key in new_keys - old_keys:
+                additions.setdefault(key, []).append(path)
+            for key in old_keys - new_keys:
+                removals.setdefault(key, set()).add(path)
+
+        for key, paths in removals.items():
+            self._write_lines(self._postings_filename(key), [path for path
+                    in self._postings(key) if path not in paths])
+        for key, paths in additions.items():
+            self._write_lines(self._postings_filename(key), paths, 'a')
+
+
+def parse_tiddler_path(path):
+    """
+    determine bag name and tiddler title from a tiddler file's repository path
+
+    returns None if `path` does not refer to a tiddler file
+    """
+    segments = path.split('/')
+    if (len(segments) != 4 or segments[0] != 'bags' or
+            segments[2] != 'tiddlers' or
+            segments[3] in ('.gitkeep', '_binaries')):
+        return None
+    bag_name, title = [urllib.unquote(segment).decode('utf-8')
+            for segment in (segments[1], segments[3])]
+    return bag_name, title
+
+
+def tiddler_changes(repo, old_commit, new_commit):
+    """
+    generates (path, old blob ID, new blob ID) tuples for tiddler files which
+    differ between two commits, blob IDs being None for absent files
+
+    `old_commit` may be None to list all tiddlers in `new_commit`
+    """
+    old_tree = repo[old_commit].tree if old_commit else None
+    new_tree = repo[new_commit].tree
+    for change in tree_changes(repo.object_store, old_tree, new_tree):
+        paths = set([change.old.path, change.new.path])
+        paths.discard(None)
+        for path in paths:
+            if parse_tiddler_path(path) is None:
+                continue
+            old_id = change.old.sha if change.old.path == path else None
+            new_id = change.new.sha if change.new.path == path else None
+            yield path, old_id, new_id
+
+
+def commits_since(repo, commit_id):
+    """
+    returns the set of IDs of commits made after the given one, up to the
+    latest commit
+
+    as commits are only ever added on top of the latest one, these are usually
+    just a few
+    """
+    latest = repo.head()
+    if latest == commit_id:
+        return set()
+    return set(entry.commit.id for entry
+            in repo.get_walker(include=[latest], exclude=[commit_id]))
+
+
+def read_tiddler_blob(repo, path, blob_id):
+    """
+    returns the tiddler stored in the given blob
+    """
+    bag_name, title = parse_tiddler_path(path)
+    tiddler = Tiddler(title, bag_name)
+    serializer = Serializer('text')
+    serializer.object = tiddler
+    serializer.from_string(repo[blob_id].as_raw_string().decode('utf-8'))
+    return tiddler
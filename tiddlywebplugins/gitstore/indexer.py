@@ -0,0 +1,63 @@
+"""
+TiddlyWeb filter indexer based on the store's attribute index
+
+enabled via `'indexer': 'tiddlywebplugins.gitstore.indexer'` in the
+configuration, this allows `select` filters on tags, fields and selected
+attributes (see `attributes.ATTRIBUTES`), as well as TiddlyWeb's lookups of
+tiddlers within recipes, to load only the matching tiddlers
+
+queries the index cannot serve raise `FilterIndexRefused`, resulting in
+TiddlyWeb's regular filtering
+"""
+
+from tiddlyweb.filters import FilterIndexRefused
+from tiddlyweb.filters.select import ATTRIBUTE_SELECTOR, default_func
+from tiddlyweb.model.tiddler import Tiddler
+from tiddlyweb.store import NoBagError, NoTiddlerError
+
+
+def index_query(environ, **kwords):
+    """
+    returns the tiddlers matching the given query, either a bag name (`bag`)
+    along with a single attribute and value or an `id` of the form
+    "<bag>:<title>"
+    """
+    store = environ['tiddlyweb.store']
+    storage = store.storage
+    if not hasattr(storage, 'select_tiddlers'):
+        raise FilterIndexRefused('store does not provide an index')
+
+    kwords = dict(kwords)
+    if 'id' in kwords:
+        if len(kwords) > 1 or kwords['id'].count(':') != 1:
+            raise FilterIndexRefused('ambiguous query: %s' % kwords)
+        bag_name, title = kwords['id'].split(':')
+        return _load(store, [Tiddler(title, bag_name)])
+
+    bag_name = kwords.pop('bag', None)
+    if bag_name is None or len(kwords) != 1:
+        raise FilterIndexRefused('unsupported query: %s' % kwords)
+    attribute, value = kwords.items()[0]
+
+    if attribute == 'title':
+        return _load(store, [Tiddler(value, bag_name)])
+
+    try:
+        tiddlers = storage.select_tiddlers(bag_name, attribute, value)
+    except ValueError, exc:
+        raise FilterIndexRefused(exc)
+
+    # guard against the index being slightly ahead of the store's reads
+    select = ATTRIBUTE_SELECTOR.get(attribute, default_func)
+    return [tiddler for tiddler in _load(store, tiddlers)
+            if select(tiddler, attribute, value)]
+
+
+def _load(store, tiddlers):
+    loaded = []
+    for tiddler in tiddlers:
+        try:
+            loaded.append(store.get(tiddler))
+        except (NoBagError, NoTiddlerError): # removed in the meantime
+            pass
+    return loaded
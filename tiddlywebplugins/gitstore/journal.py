@@ -0,0 +1,205 @@
+"""
+write-ahead journal of pending commits along with a background writer
+committing them
+
+writes record the files they are about to touch in the journal before
+modifying them, so an interrupted write can be committed upon restart
+
+in asynchronous durability modes, writes return immediately after modifying
+their files; a dedicated thread then commits journal entries in order,
+coalescing any which have accumulated in the meantime and retrying failed
+commits
+"""
+
+import os
+import time
+import errno
+import atexit
+import logging
+
+from uuid import uuid4
+from Queue import Queue, Empty
+from threading import Thread, Lock, Condition
+
+import simplejson
+
+from .locks import FileLock
+from .stats import timed
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+DURABILITY_MODES = ['sync', 'async', 'async-fsync']
+
+RETRY_DELAY = 0.1 # seconds, doubled after each consecutive failure
+MAX_RETRY_DELAY = 10
+EXIT_TIMEOUT = 30 # seconds to wait for pending commits upon exit
+
+
+class Journal(object):
+    """
+    append-only log of intended commits
+
+    each line is a JSON object, either describing a change (`id`, `pid`,
+    `message`, `author`, `committer`, `paths`) or marking changes as committed
+    (`done`)
+
+    the journal may be shared by multiple processes
+    """
+
+    def __init__(self, filename, fsync=False):
+        self.filename = filename
+        self.fsync = fsync
+        self._lock = Lock()
+
+    def append(self, message, author, committer, paths):
+        """
+        record an intended commit, returning the respective entry
+        """
+        with timed('journal'), self._lock, self._file_lock():
+            entry = {
+                'id': uuid4().hex,
+                'pid': os.getpid(),
+                'message': message,
+                'author': author,
+                'committer': committer,
+                'paths': paths
+            }
+            self._write(entry)
+        return entry
+
+    def complete(self, entries):
+        """
+        mark the given entries as committed, discarding the journal's contents
+        once there are no more pending entries
+        """
+        with timed('journal'), self._lock, self._file_lock():
+            self._write({ 'done': [entry['id'] for entry in entries] })
+            if not self.pending():
+                os.remove(self.filename)
+
+    def pending(self):
+        """
+        returns the list of entries which have not been committed yet
+        """
+        try:
+            with open(self.filename) as fh:
+                lines = fh.read().splitlines()
+        except IOError: # no journal
+            return []
+
+        entries = []
+        done = set()
+        for line in lines:
+            try:
+                record = simplejson.loads(line)
+            except ValueError: # incomplete write
+                continue
+            if 'done' in record:
+                done.update(record['done'])
+            else:
+                entries.append(record)
+        return [entry for entry in entries if entry['id'] not in done]
+
+    def orphaned(self):
+        """
+        returns the list of pending entries whose owning process has terminated
+        """
+        return [entry for entry in self.pending()
+                if not _process_alive(entry.get('pid'))]
+
+    def _file_lock(self):
+        return FileLock('%s.lock' % self.filename, kind='journal')
+
+    def _write(self, record):
+        with open(self.filename, 'a') as fh:
+            fh.write('%s\n' % simplejson.dumps(record))
+            if self.fsync:
+                fh.flush()
+                os.fsync(fh.fileno())
+
+
+def _process_alive(pid):
+    if pid is None: # legacy entry
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError, exc:
+        return exc.errno == errno.EPERM # exists, but owned by another user
+    return True
+
+
+class CommitWriter(object):
+    """
+    background thread committing journal entries in order
+
+    `commit` is a function which is passed a list of journal entries and
+    commits the respective changes
+
+    failed commits are retried with increasing delays, subsequent entries being
+    committed along with them
+    """
+
+    def __init__(self, journal, commit):
+        self.journal = journal
+        self._commit = commit
+        self._queue = Queue()
+        self._idle = Condition()
+        self._busy = 0
+        self._thread = Thread(target=self._run, name='gitstore commit writer')
+        self._thread.daemon = True
+        self._thread.start()
+        # entries still pending after that are recovered upon restart
+        atexit.register(self.flush, EXIT_TIMEOUT)
+
+    def submit(self, entry):
+        with self._idle:
+            self._busy += 1
+        self._queue.put(entry)
+
+    def flush(self, timeout=None):
+        """
+        block until all submitted entries have been committed
+
+        returns False if this did not happen within `timeout` seconds
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._idle:
+            while self._busy:
+                if deadline is None:
+                    self._idle.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._idle.wait(remaining)
+        return True
+
+    def _run(self):
+        entries = []
+        delay = RETRY_DELAY
+        while True:
+            if not entries:
+                entries.append(self._queue.get())
+            try: # coalesce any entries which have accumulated
+                while True:
+                    entries.append(self._queue.get_nowait())
+            except Empty:
+                pass
+
+            try:
+                self._commit(entries)
+                self.journal.complete(entries)
+            except Exception, exc: # entries remain pending in the journal
+                LOGGER.exception('unable to commit journal entries, retrying '
+                        'in %s seconds: %s', delay, exc)
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                continue
+            delay = RETRY_DELAY
+
+            with self._idle:
+                self._busy -= len(entries)
+                self._idle.notify_all()
+            entries = []
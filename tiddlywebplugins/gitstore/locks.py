@@ -0,0 +1,230 @@
+"""
+advisory locks based on `fcntl.flock`, serializing access both across processes
+and across threads (each acquisition opens its own file description)
+
+tiddlers (and other entities) are protected by a fixed number of lock files,
+their paths being hashed onto these stripes, while a separate lock serializes
+updates of the Git index and refs
+
+wait times are recorded in `LOCK_STATS` as well as the `lock:<kind>` phase of
+the store's timings
+"""
+
+import os
+import time
+import errno
+import fcntl
+import select
+import logging
+
+from hashlib import sha1
+from threading import Thread, Lock
+
+from tiddlyweb.store import StoreLockError
+
+from . import stats
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+LOCK_STRIPES = 256
+LOCK_TIMEOUT = 10 # seconds
+
+
+class LockTimeout(StoreLockError):
+    pass
+
+
+class FileLock(object):
+    """
+    exclusive advisory lock
+
+    waiting blocks within the kernel, so waiters are woken as soon as the lock
+    is released; as `flock` does not support timed waits, a contended lock with
+    a `timeout` is awaited in a helper thread, raising `LockTimeout` once
+    `timeout` seconds have passed
+
+    `kind` categorizes wait times in `LOCK_STATS`
+    """
+
+    def __init__(self, filename, timeout=None, kind='file'):
+        self.filename = filename
+        self.timeout = timeout
+        self.kind = kind
+        self._fh = None
+
+    def acquire(self):
+        start = time.time()
+        fh = open(self.filename, 'a')
+        try:
+            if self.timeout is None:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            else:
+                self._acquire_within(fh, start)
+        except:
+            fh.close()
+            raise
+        self._fh = fh
+        LOCK_STATS.record(self.kind, time.time() - start)
+
+    def release(self):
+        fcntl.flock(self._fh, fcntl.LOCK_UN)
+        self._fh.close()
+        self._fh = None
+
+    def _acquire_within(self, fh, start):
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return
+        except IOError, exc:
+            if exc.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+
+        remaining = start + self.timeout - time.time()
+        if remaining > 0 and _LockWaiter(fh).wait(remaining):
+            return
+        LOCK_STATS.record(self.kind, time.time() - start, True)
+        raise LockTimeout('unable to acquire %s lock %s within %ss' %
+                (self.kind, self.filename, self.timeout))
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class _LockWaiter(object):
+    """
+    blocks on `flock` for the given file in a separate thread, signaling
+    acquisition through a pipe so it can be awaited with a timeout
+
+    the thread uses a duplicate descriptor, which shares the lock with the
+    original file; if waiting is abandoned, the lock is released again as soon
+    as it has been acquired
+    """
+
+    def __init__(self, fh):
+        self._fd = os.dup(fh.fileno())
+        self._signal, self._notify = os.pipe()
+        self._lock = Lock()
+        self._finished = False
+        self._abandoned = False
+        self._error = None
+        thread = Thread(target=self._run, name='gitstore lock waiter')
+        thread.daemon = True
+        thread.start()
+
+    def wait(self, timeout):
+        """
+        returns True once the lock has been acquired, False if `timeout` seconds
+        have passed before
+        """
+        try:
+            select.select([self._signal], [], [], timeout)
+        finally:
+            os.close(self._signal)
+        with self._lock:
+            if not self._finished:
+                self._abandoned = True
+                return False
+        if self._error:
+            raise self._error
+        return True
+
+    def _run(self):
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except IOError, exc:
+            self._error = exc
+        with self._lock:
+            self._finished = True
+            if self._abandoned and not self._error:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        try:
+            os.write(self._notify, '\0')
+        except OSError: # waiting has been abandoned
+            pass
+        finally:
+            os.close(self._notify)
+
+
+class MultiLock(object):
+    """
+    acquires a set of locks in the given order, releasing them in reverse
+
+    callers must use a consistent order (e.g. sorted by file name) to avoid
+    deadlocks
+    """
+
+    def __init__(self, locks):
+        self.locks = locks
+
+    def __enter__(self):
+        acquired = []
+        try:
+            for lock in self.locks:
+                lock.acquire()
+                acquired.append(lock)
+        except:
+            for lock in reversed(acquired):
+                lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        for lock in reversed(self.locks):
+            lock.release()
+
+
+def stripe_filename(lock_dir, key):
+    """
+    returns the name of the lock file protecting `key`
+    """
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    stripe = int(sha1(key).hexdigest(), 16) % LOCK_STRIPES
+    return os.path.join(lock_dir, '%02x' % stripe)
+
+
+class LockStats(object):
+    """
+    aggregate lock wait times, by kind of lock
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._stats = {}
+
+    def record(self, kind, wait, timed_out=False):
+        stats.record('lock:%s' % kind, wait)
+        with self._lock:
+            kind_stats = self._stats.setdefault(kind, { 'acquisitions': 0,
+                    'timeouts': 0, 'wait': 0.0, 'max_wait': 0.0 })
+            if timed_out:
+                kind_stats['timeouts'] += 1
+            else:
+                kind_stats['acquisitions'] += 1
+            kind_stats['wait'] += wait
+            kind_stats['max_wait'] = max(kind_stats['max_wait'], wait)
+        if wait > 1:
+            LOGGER.debug('waited %.3fs for %s lock', wait, kind)
+
+    def snapshot(self):
+        """
+        returns a copy of the current statistics, mapping kinds of locks to
+        `acquisitions`, `timeouts`, total `wait` and `max_wait` (in seconds)
+        """
+        with self._lock:
+            return dict((kind, dict(stats))
+                    for kind, stats in self._stats.items())
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+LOCK_STATS = LockStats()
@@ -0,0 +1,155 @@
+"""
+persistent index of tiddler modifications ordered by commit time, both across
+the entire store and per bag
+
+each scope keeps an append-only log of the commits touching its tiddlers, so the
+most recent modifications can be determined by reading the log backwards,
+without examining any other tiddlers - superseded entries are removed once a
+log has grown to twice its size after the previous compaction
+"""
+
+import os
+
+from .index import Index, parse_tiddler_path, commits_since
+from .stats import timed
+
+
+CHUNK_SIZE = 64 * 1024 # bytes
+
+
+class RecentIndex(Index):
+    """
+    maps bags (and the store as a whole) to the modifications of their
+    tiddlers, in the order of the respective commits
+    """
+
+    name = 'recent'
+
+    def recent(self, repo, bag_name=None, head=None):
+        """
+        generates (bag name, title, commit ID) tuples for tiddlers in the given
+        bag (or any bag if None), most recently modified first, disregarding
+        deleted tiddlers
+
+        if `head` is given, commits made after it are disregarded
+        """
+        with timed('recent'):
+            self.update(repo)
+            newer = commits_since(repo, head) if head else set()
+        seen = set()
+        for line in _reverse_lines(self._log_filename(bag_name)):
+            _, commit_id, operation, path = line.split(' ', 3)
+            if commit_id in newer or path in seen:
+                continue
+            seen.add(path)
+            if operation == 'D':
+                continue
+            tiddler_bag, title = parse_tiddler_path(path)
+            yield tiddler_bag, title, commit_id
+
+    def _update(self, repo, indexed, head):
+        self._append((entry.commit, _modifications(entry))
+                for entry in self._new_commits(repo, indexed, head))
+
+    def _advance(self, repo, parent, head, changes):
+        modifications = dict((path, 'M' if new_id else 'D')
+                for path, _, new_id in changes
+                if parse_tiddler_path(path) is not None)
+        self._append([(repo[head], modifications)])
+
+    def _append(self, modifications):
+        """
+        log the given (commit, modifications) tuples, modifications mapping
+        tiddler paths to "D" for removals and "M" otherwise
+        """
+        logs = {}
+        for commit, paths in modifications:
+            for path, operation in sorted(paths.items()):
+                line = '%s %s %s %s' % (commit.commit_time, commit.id,
+                        operation, path)
+                bag_name, _ = parse_tiddler_path(path)
+                for log in (self._log_filename(), self._log_filename(bag_name)):
+                    logs.setdefault(log, []).append(line)
+
+        for log, lines in logs.items():
+            self._write_lines(log, lines, 'a')
+            self._compact(log)
+
+    def _compact(self, log):
+        """
+        remove superseded entries if the given log has grown sufficiently
+        """
+        size = os.path.getsize(log)
+        marker = log + '.compacted'
+        compacted = self._read_lines(marker)
+        if compacted and size < 2 * int(compacted[0]):
+            return
+
+        seen = set()
+        lines = []
+        for line in _reverse_lines(log):
+            _, _, operation, path = line.split(' ', 3)
+            if path in seen:
+                continue
+            seen.add(path)
+            if operation != 'D':
+                lines.append(line)
+        lines.reverse()
+        self._write_lines(log, lines)
+        self._write_lines(marker, [max(os.path.getsize(log), CHUNK_SIZE)])
+
+    def _log_filename(self, bag_name=None):
+        if bag_name is None:
+            return os.path.join(self.index_dir, 'logs', 'all')
+        return self._key_filename('bags', bag_name)
+
+
+def _modifications(entry):
+    """
+    maps the tiddler files affected by the commit of the given walker entry to
+    "D" for removals and "M" otherwise
+    """
+    changes = entry.changes()
+    if len(entry.commit.parents) > 1: # merge commit
+        changes = [change for parent_changes in changes
+                for change in parent_changes]
+
+    modifications = {}
+    for change in changes:
+        if change.old.path and change.old.path != change.new.path:
+            modifications.setdefault(change.old.path, 'D')
+        if change.new.path:
+            modifications[change.new.path] = 'M'
+    return dict((path, operation) for path, operation in modifications.items()
+            if parse_tiddler_path(path) is not None)
+
+
+def _reverse_lines(filename):
+    """
+    generates the lines of the given file, last one first
+
+    an incomplete last line, e.g. due to a concurrent append, is skipped
+    """
+    try:
+        fh = open(filename, 'rb')
+    except IOError: # no entries
+        return
+    with fh:
+        fh.seek(0, os.SEEK_END)
+        position = fh.tell()
+        remainder = ''
+        tail = True # until the end of the last complete line is found
+        while position > 0:
+            size = min(CHUNK_SIZE, position)
+            position -= size
+            fh.seek(position)
+            lines = (fh.read(size) + remainder).split('\n')
+            remainder = lines.pop(0)
+            if tail and lines:
+                lines.pop() # empty or incomplete
+                tail = False
+            for line in reversed(lines):
+                if line:
+                    yield line
+        if remainder and not tail:
+            yield remainder
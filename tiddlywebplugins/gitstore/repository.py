@@ -0,0 +1,359 @@
+"""
+process-wide registry of repository handles
+
+TiddlyWeb instantiates a store for each request; sharing the underlying
+repository handle means pack indexes, object caches and derived indexes
+survive between requests
+"""
+
+import os
+import stat
+
+from threading import Lock, RLock
+
+from dulwich.repo import Repo
+from dulwich.index import Index, index_entry_from_stat
+from dulwich.objects import Tree
+from dulwich.errors import NotGitRepository
+
+from .commits import CommitGroup
+from .revisions import RevisionIndex
+from .search import SearchIndex
+from .attributes import AttributeIndex
+from .recent import RecentIndex
+from .streams import add_blob_from_file
+from .journal import Journal, CommitWriter, DURABILITY_MODES
+from .housekeeping import Housekeeper, SharedObjectStore
+from .stats import add_sink, timed
+from .locks import FileLock, MultiLock, stripe_filename, LOCK_TIMEOUT
+
+
+_REPOSITORIES = {} # store root -> Repository
+_REPOSITORIES_LOCK = Lock()
+
+
+def get_repository(root, store_config):
+    """
+    returns the process-wide Repository for the store at `root`, initializing
+    the underlying Git repository if necessary
+    """
+    with _REPOSITORIES_LOCK:
+        try:
+            return _REPOSITORIES[root]
+        except KeyError:
+            _REPOSITORIES[root] = Repository(root, store_config)
+            return _REPOSITORIES[root]
+
+
+class Repository(object):
+    """
+    shared state for a store's Git repository
+
+    `lock` must be held while modifying the repository; commits are also
+    serialized across processes by a file lock, while `path_locks` protects
+    individual files during writes
+
+    the Git index is kept in memory between commits, only being reloaded if
+    modified by another process
+
+    the object store may be read by multiple threads at once
+
+    unless disabled, `housekeeper` repacks the object store in the background
+
+    every change is recorded in the journal before any files are modified; in
+    asynchronous durability modes, `writer` commits the respective entries
+
+    changes left pending by an interrupted process are committed upon
+    initialization
+    """
+
+    def __init__(self, root, store_config):
+        try:
+            self.repo = Repo(root)
+        except NotGitRepository:
+            self.repo = Repo.init(root)
+        self.repo.object_store = SharedObjectStore.from_config(
+                self.repo.object_store.path, self.repo.get_config())
+        self.lock = RLock()
+        self._index = None
+        self._index_signature = None
+
+        index_dir = os.path.join(self.repo.controldir(), 'tiddlyweb')
+        self.revisions = RevisionIndex(os.path.join(index_dir,
+                RevisionIndex.name))
+        self.search = SearchIndex(os.path.join(index_dir, SearchIndex.name))
+        self.attributes = AttributeIndex(os.path.join(index_dir,
+                AttributeIndex.name))
+        self.recent = RecentIndex(os.path.join(index_dir, RecentIndex.name))
+        self.indexes = [self.revisions, self.search, self.attributes,
+                self.recent]
+
+        stats_sink = store_config.get('stats_sink')
+        if stats_sink:
+            add_sink(__import__(stats_sink, {}, {}, ['record']))
+
+        group_commit = store_config.get('group_commit')
+        if group_commit:
+            self.commit_group = CommitGroup(**group_commit)
+        else:
+            self.commit_group = None
+
+        durability = store_config.get('durability', 'sync')
+        if durability not in DURABILITY_MODES:
+            raise ValueError('invalid durability mode: %s' % durability)
+        if self.repo.bare and durability != 'sync':
+            raise ValueError('bare repositories only support synchronous '
+                    'durability')
+        self.lock_timeout = store_config.get('lock_timeout', LOCK_TIMEOUT)
+        self._lock_dir = os.path.join(index_dir, 'locks')
+        try:
+            os.makedirs(self._lock_dir)
+        except OSError: # already exists
+            pass
+        housekeeping = store_config.get('housekeeping', {})
+        if housekeeping is False:
+            self.housekeeper = None
+        else:
+            self.housekeeper = Housekeeper(self.repo,
+                    os.path.join(self._lock_dir, 'housekeeping'),
+                    **housekeeping)
+
+        self.journal = Journal(os.path.join(index_dir, 'journal'),
+                fsync=(durability == 'async-fsync'))
+        self._recover()
+        if durability == 'sync':
+            self.writer = None
+        else:
+            self.writer = CommitWriter(self.journal, self._commit_entries)
+
+    def commit(self, changes, committer, summary='group commit'):
+        """
+        commit a set of changes, each a tuple of message, author and relative
+        file paths
+
+        `summary` prefixes the message of commits combining multiple changes
+
+        returns the new commit's hash, or that of the latest commit if the
+        changes are identical to the files' committed contents
+        """
+        if len(changes) == 1:
+            message, author, _ = changes[0]
+        else:
+            message = '%s: %s changes\n\n%s' % (summary, len(changes),
+                    '\n'.join(msg for msg, _, _ in changes))
+            authors = set(author for _, author, _ in changes)
+            author = authors.pop() if len(authors) == 1 else committer
+
+        relative_paths = [path for _, _, paths in changes for path in paths]
+        with self.lock, self._commit_lock():
+            tree_changes = self.stage(relative_paths)
+            return self._do_commit(message, author, committer, tree_changes)
+
+    def commit_objects(self, message, author, committer, tree_changes):
+        """
+        commit the given changes, tuples of path, mode and ID of an object
+        already in the object store (None for removals), without involving the
+        working tree or index
+
+        returns the new commit's hash, or that of the latest commit if nothing
+        changed
+        """
+        with self.lock, self._commit_lock():
+            return self._do_commit(message, author, committer, tree_changes)
+
+    def _do_commit(self, message, author, committer, tree_changes):
+        try:
+            parent = self.repo.head()
+        except KeyError: # no commits yet
+            parent = None
+        with timed('commit'):
+            tree_id, changes = self._commit_tree(parent, tree_changes)
+            if parent and tree_id == self.repo[parent].tree: # nothing changed
+                return parent
+            commit_id = self.repo.do_commit(message.encode('UTF-8'),
+                    author=author.encode('UTF-8'),
+                    committer=committer.encode('UTF-8'),
+                    tree=tree_id)
+        with timed('index'):
+            for index in self.indexes:
+                index.advance(self.repo, parent, commit_id, changes)
+        if self.housekeeper:
+            self.housekeeper.notify()
+        return commit_id
+
+    def path_locks(self, relative_paths):
+        """
+        returns a context manager holding exclusive locks for the given paths
+        """
+        filenames = sorted(set(stripe_filename(self._lock_dir, path)
+                for path in relative_paths))
+        return MultiLock([FileLock(filename, self.lock_timeout, 'path')
+                for filename in filenames])
+
+    def stage(self, relative_paths):
+        """
+        stage the given files with a single index update, adding their contents
+        to the object store without reading them into memory
+
+        returns the resulting changes as tuples of path, mode and blob ID (None
+        for removals)
+        """
+        with self.lock, timed('stage'):
+            index = self._open_index()
+            changes = {}
+            for path in relative_paths:
+                if isinstance(path, unicode):
+                    path = path.encode('utf-8')
+                filename = os.path.join(self.repo.path, path)
+                try:
+                    st = os.lstat(filename)
+                except OSError: # removed
+                    st = None
+                if st is None or stat.S_ISDIR(st.st_mode):
+                    try:
+                        del index[path]
+                    except KeyError: # not tracked
+                        continue
+                    changes[path] = (path, None, None)
+                else:
+                    blob_id = add_blob_from_file(self.repo.object_store,
+                            filename, st.st_size)
+                    entry = index_entry_from_stat(st, blob_id, 0)
+                    index[path] = entry
+                    changes[path] = (path, entry.mode, blob_id)
+            index.write()
+            self._index_signature = _file_signature(self.repo.index_path())
+        return changes.values()
+
+    def _open_index(self):
+        """
+        returns the in-memory Git index, reloading it if the index file has been
+        modified since
+        """
+        filename = self.repo.index_path()
+        signature = _file_signature(filename)
+        if self._index is None or signature != self._index_signature:
+            self._index = Index(filename)
+            self._index_signature = signature
+        return self._index
+
+    def _commit_tree(self, parent, tree_changes):
+        """
+        returns the ID of the tree resulting from applying the given changes to
+        the parent commit's tree, only rewriting the trees along the respective
+        paths
+
+        also returns the effective changes as tuples of path, old and new blob ID
+        (None for absent files), as needed for updating indexes
+        """
+        tree = self.repo[self.repo[parent].tree] if parent else Tree()
+        previous = {}
+        tree = _commit_tree_changes(self.repo.object_store, tree, tree_changes,
+                previous)
+        current = dict((path, (mode, blob_id))
+                for path, mode, blob_id in tree_changes)
+        changes = []
+        for path, entry in sorted(previous.items()):
+            # files within removed directories are absent from `current`
+            mode, blob_id = current.get(path, (None, None))
+            if entry != (mode, blob_id):
+                changes.append((path, entry[1], blob_id))
+        return tree.id, changes
+
+    def _commit_lock(self):
+        return FileLock(os.path.join(self._lock_dir, 'commit'),
+                self.lock_timeout, 'commit')
+
+    def _recover(self):
+        """
+        roll forward changes which were recorded in the journal but not
+        committed, e.g. due to a crash
+
+        only entries whose owning process has terminated are considered, as
+        others might still be in progress
+
+        files might have been modified only partially, but each one is replaced
+        atomically, so committing their current state is always consistent
+        """
+        entries = self.journal.orphaned()
+        if not entries:
+            return
+        paths = [path for entry in entries for path in entry['paths']]
+        with self.path_locks(paths), self.lock:
+            # another process might have recovered them in the meantime
+            pending = set(entry['id'] for entry in self.journal.pending())
+            entries = [entry for entry in entries if entry['id'] in pending]
+            if entries:
+                self._commit_entries(entries, 'journal recovery')
+                self.journal.complete(entries)
+
+    def _commit_entries(self, entries, summary='group commit'):
+        """
+        commit the changes described by the given journal entries
+        """
+        changes = [(entry['message'], entry['author'], entry['paths'])
+                for entry in entries]
+        return self.commit(changes, entries[-1]['committer'], summary)
+
+
+def _commit_tree_changes(object_store, tree, changes, previous, prefix=''):
+    """
+    variant of dulwich's `commit_tree_changes` which also records the original
+    mode and object ID of each changed path in `previous` (both None for paths
+    which did not exist)
+
+    removing a directory records each of the files within it
+    """
+    nested_changes = {}
+    for path, mode, object_id in changes:
+        try:
+            dirname, subpath = path.split('/', 1)
+        except ValueError:
+            entry = tree[path] if path in tree else (None, None)
+            if object_id is None and entry[0] and stat.S_ISDIR(entry[0]):
+                _record_files(object_store, entry[1], '%s%s/' % (prefix, path),
+                        previous)
+            else:
+                previous[prefix + path] = entry
+            if object_id is None:
+                if path in tree:
+                    del tree[path]
+            else:
+                tree[path] = (mode, object_id)
+        else:
+            nested_changes.setdefault(dirname, []).append((subpath, mode,
+                    object_id))
+
+    for name, subchanges in nested_changes.items():
+        try:
+            subtree = object_store[tree[name][1]]
+        except KeyError: # new directory
+            subtree = Tree()
+        subtree = _commit_tree_changes(object_store, subtree, subchanges,
+                previous, '%s%s/' % (prefix, name))
+        if len(subtree) == 0:
+            del tree[name]
+        else:
+            tree[name] = (stat.S_IFDIR, subtree.id)
+    object_store.add_object(tree)
+    return tree
+
+
+def _record_files(object_store, tree_id, prefix, previous):
+    """
+    records mode and object ID of all files within the given tree in `previous`
+    """
+    for name, mode, object_id in object_store[tree_id].iteritems():
+        if stat.S_ISDIR(mode):
+            _record_files(object_store, object_id, '%s%s/' % (prefix, name),
+                    previous)
+        else:
+            previous[prefix + name] = (mode, object_id)
+
+
+def _file_signature(filename):
+    try:
+        st = os.stat(filename)
+    except OSError: # no such file
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime)
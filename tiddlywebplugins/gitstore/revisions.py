@@ -0,0 +1,103 @@
+"""
+persistent index of the commits which touched any given path
+
+this avoids shelling out to `git log` for revision lookups, which would require
+traversing the entire history
+
+the index keeps one file per path, listing the respective commit IDs in
+chronological order
+"""
+
+from .index import Index, commits_since
+from .stats import timed
+
+
+class RevisionIndex(Index):
+    """
+    maps repository paths to the commits which modified them
+    """
+
+    name = 'revisions'
+
+    def revisions(self, repo, path):
+        """
+        returns the IDs of all commits touching `path`, most recent first
+        """
+        with timed('revisions'):
+            self.update(repo)
+            revisions = self._read(path)
+        revisions.reverse()
+        return revisions
+
+    def latest(self, repo, path, head=None):
+        """
+        returns the ID of the latest commit touching `path` or None
+
+        if `head` is given, commits made after it are disregarded
+        """
+        with timed('revisions'):
+            self.update(repo)
+            revisions = self._read(path)
+            if head is not None and revisions and revisions[-1] != head:
+                revisions = _until(repo, revisions, head)
+        return revisions[-1] if revisions else None
+
+    def _update(self, repo, indexed, head):
+        self._append(_changes_by_path(self._new_commits(repo, indexed, head)))
+
+    def _advance(self, repo, parent, head, changes):
+        self._append(dict((path, [head]) for path, _, _ in changes))
+
+    def _append(self, changes):
+        for path, commit_ids in changes.items():
+            existing = set(self._read(path)) # guards against interrupted updates
+            commit_ids = [commit_id for commit_id in commit_ids
+                    if commit_id not in existing]
+            self._write(path, commit_ids, 'a')
+
+    def _read(self, path):
+        return self._read_lines(self._key_filename('paths', path))
+
+    def _write(self, path, commit_ids, mode):
+        self._write_lines(self._key_filename('paths', path), commit_ids, mode)
+
+
+def _until(repo, revisions, head):
+    """
+    discard revisions made after `head`
+
+    the latest commit is determined after reading the index, so it includes all
+    indexed revisions
+    """
+    newer = commits_since(repo, head)
+    return [commit_id for commit_id in revisions if commit_id not in newer]
+
+
+def _changes_by_path(entries):
+    """
+    maps paths to the IDs of the commits affecting them, in the order of the
+    given walker entries
+    """
+    changes = {}
+    for entry in entries:
+        commit_id = entry.commit.id
+        for path in _changed_paths(entry):
+            changes.setdefault(path, []).append(commit_id)
+    return changes
+
+
+def _changed_paths(entry):
+    """
+    returns the paths affected by the commit of the given walker entry
+    """
+    changes = entry.changes()
+    if len(entry.commit.parents) > 1: # merge commit
+        changes = [change for parent_changes in changes
+                for change in parent_changes]
+
+    paths = set()
+    for change in changes:
+        for path in (change.old.path, change.new.path):
+            if path is not None:
+                paths.add(path)
+    return paths
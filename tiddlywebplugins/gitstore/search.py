@@ -0,0 +1,68 @@
+"""
+persistent inverted index for tiddler search
+
+terms are extracted from titles, tags, fields and (non-binary) text; for each
+term, the index keeps a postings file listing the paths of matching tiddlers
+"""
+
+import re
+
+from tiddlyweb.util import binary_tiddler
+
+from .index import PostingsIndex, parse_tiddler_path
+
+
+def tokenize(text):
+    """
+    returns the set of normalized terms within `text`
+    """
+    if isinstance(text, str):
+        text = text.decode('utf-8')
+    return set(term.encode('utf-8') for term
+            in re.findall(r'\w+', text.lower(), re.UNICODE))
+
+
+class SearchIndex(PostingsIndex):
+    """
+    maps terms to the tiddlers containing them
+    """
+
+    name = 'search'
+
+    def search(self, repo, query):
+        """
+        generates (bag name, title) tuples for tiddlers containing all terms
+        within `query`
+        """
+        self.update(repo)
+
+        terms = tokenize(query)
+        if not terms:
+            return
+
+        postings = None
+        for term in terms:
+            paths = set(self._postings(term))
+            postings = paths if postings is None else postings & paths
+            if not postings:
+                return
+
+        for path in sorted(postings):
+            yield parse_tiddler_path(path)
+
+    def _keys(self, tiddler):
+        return _tiddler_terms(tiddler)
+
+    def _postings_filename(self, term):
+        return self._key_filename('terms', term)
+
+
+def _tiddler_terms(tiddler):
+    terms = tokenize(tiddler.title)
+    for tag in tiddler.tags:
+        terms.update(tokenize(tag))
+    for value in tiddler.fields.values():
+        terms.update(tokenize(value))
+    if not binary_tiddler(tiddler):
+        terms.update(tokenize(tiddler.text))
+    return terms
@@ -0,0 +1,118 @@
+"""
+timings for the store's internal phases (e.g. lock acquisition, serialization,
+staging, committing)
+
+each duration is recorded both for the current request, available as
+`tiddlyweb.gitstore.timings` in the WSGI environ, and in any registered sinks -
+by default just `AGGREGATE`, which accumulates timings across all requests
+within the process
+
+a request's timings are collected from the store's instantiation until
+`deactivate` is called (see `web.RequestTimings`) or another request is handled
+by the same thread
+
+sinks are objects (e.g. modules) providing a `record(phase, duration)` function;
+additional sinks can be registered via the `stats_sink` store option, naming the
+respective module
+
+phases may be nested, e.g. `lock:path` waits occur within writes
+"""
+
+import logging
+
+from threading import Lock, local
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+ENVIRON_KEY = 'tiddlyweb.gitstore.timings'
+
+
+class Timings(object):
+    """
+    accumulates the number of occurrences and total duration per phase
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._phases = {}
+
+    def record(self, phase, duration):
+        with self._lock:
+            stats = self._phases.setdefault(phase, { 'count': 0, 'time': 0.0 })
+            stats['count'] += 1
+            stats['time'] += duration
+
+    def snapshot(self):
+        """
+        returns a copy of the current timings, mapping phases to `count` and
+        total `time` (in seconds)
+        """
+        with self._lock:
+            return dict((phase, dict(stats))
+                    for phase, stats in self._phases.items())
+
+    def reset(self):
+        with self._lock:
+            self._phases = {}
+
+
+AGGREGATE = Timings()
+SINKS = [AGGREGATE]
+
+_CURRENT = local()
+
+
+def add_sink(sink):
+    """
+    register an additional sink, unless already present
+    """
+    if sink not in SINKS:
+        SINKS.append(sink)
+
+
+def activate(environ):
+    """
+    collect subsequent timings within the current thread for the request
+    described by the given WSGI environ
+
+    returns the request's Timings
+    """
+    timings = environ.get(ENVIRON_KEY)
+    if timings is None:
+        timings = environ[ENVIRON_KEY] = Timings()
+    _CURRENT.timings = timings
+    return timings
+
+
+def deactivate(environ):
+    """
+    stop collecting timings within the current thread for the request described
+    by the given WSGI environ, i.e. at the end of the request
+    """
+    timings = getattr(_CURRENT, 'timings', None)
+    if timings is not None and timings is environ.get(ENVIRON_KEY):
+        _CURRENT.timings = None
+
+
+def record(phase, duration):
+    timings = getattr(_CURRENT, 'timings', None)
+    if timings is not None:
+        timings.record(phase, duration)
+    for sink in SINKS:
+        try:
+            sink.record(phase, duration)
+        except Exception, exc: # sinks must not break the store
+            LOGGER.warn('unable to record timing with %s: %s', sink, exc)
+
+
+@contextmanager
+def timed(phase):
+    start = timer()
+    try:
+        yield
+    finally:
+        record(phase, timer() - start)
@@ -0,0 +1,133 @@
+"""
+streaming I/O helpers, avoiding whole-file buffering for potentially large
+contents like binary tiddlers
+"""
+
+import os
+import zlib
+import tempfile
+
+from hashlib import sha1
+
+
+CHUNK_SIZE = 64 * 1024 # bytes
+
+
+def write_stream(filename, data):
+    """
+    write `data`, either a string or a file-like object, to the given file in
+    chunks
+
+    returns the SHA-1 hex digest of the contents
+    """
+    digest = sha1()
+    with open(filename, 'wb') as fh:
+        if hasattr(data, 'read'):
+            for chunk in iter(lambda: data.read(CHUNK_SIZE), ''):
+                digest.update(chunk)
+                fh.write(chunk)
+        else:
+            digest.update(data)
+            fh.write(data)
+    return digest.hexdigest()
+
+
+def file_digest(filename):
+    """
+    returns the SHA-1 hex digest of the given file's contents
+    """
+    digest = sha1()
+    with open(filename, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), ''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def add_blob_from_file(object_store, filename, size):
+    """
+    add the contents of the given file to the object store as a loose blob,
+    hashing and compressing it in chunks
+
+    returns the blob's ID
+    """
+    digest = sha1()
+    compressor = zlib.compressobj()
+    header = 'blob %d\0' % size
+
+    fd, tmp_filename = tempfile.mkstemp(dir=object_store.path)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            digest.update(header)
+            out.write(compressor.compress(header))
+            with open(filename, 'rb') as fh:
+                for chunk in iter(lambda: fh.read(CHUNK_SIZE), ''):
+                    digest.update(chunk)
+                    out.write(compressor.compress(chunk))
+            out.write(compressor.flush())
+
+        blob_id = digest.hexdigest()
+        if blob_id in object_store:
+            os.remove(tmp_filename)
+        else:
+            path = os.path.join(object_store.path, blob_id[:2], blob_id[2:])
+            try:
+                os.mkdir(os.path.dirname(path))
+            except OSError: # already exists
+                pass
+            os.chmod(tmp_filename, 0444)
+            os.rename(tmp_filename, path)
+    except Exception:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+    return blob_id
+
+
+class FileStream(object):
+    """
+    file-like, iterable wrapper for a file's contents, suitable as WSGI response
+    body
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._fh = open(filename, 'rb')
+
+    def __iter__(self):
+        return iter(lambda: self._fh.read(CHUNK_SIZE), '')
+
+    def __len__(self):
+        return os.fstat(self._fh.fileno()).st_size
+
+    def read(self, size=-1):
+        return self._fh.read(size)
+
+    def seek(self, offset, whence=0):
+        self._fh.seek(offset, whence)
+
+    def close(self):
+        self._fh.close()
+
+
+def verified_stream(filename, digest):
+    """
+    returns a FileStream for the given file if its contents match the given
+    SHA-1 hex digest, None otherwise (e.g. if the file has been replaced)
+
+    the contents are verified through the stream's own file descriptor, which
+    is kept open, so replacing the file afterwards does not affect the stream;
+    however, this only detects changes made before reading starts - the file
+    being modified in place while it is being read goes unnoticed
+    """
+    try:
+        stream = FileStream(filename)
+    except IOError: # removed
+        return None
+    actual = sha1()
+    for chunk in stream:
+        actual.update(chunk)
+    if actual.hexdigest() != digest:
+        stream.close()
+        return None
+    stream.seek(0)
+    return stream
@@ -0,0 +1,204 @@
+"""
+HTTP interface for store-specific features
+
+enabled by adding `tiddlywebplugins.gitstore.web` to `system_plugins`
+
+    GET /bags/{bag_name}/changes[?since=<commit ID>]
+
+returns a JSON object describing which tiddlers were `added`, `modified` or
+`deleted` since the given commit (or all tiddlers if omitted), along with the
+current commit's ID as `head`, to be used as `since` for the next request
+
+in addition, conditional GETs of tiddlers within bags are answered without
+loading the respective tiddler (see `ConditionalGet`) and the collection of
+per-request timings ends with each request (see `RequestTimings`)
+"""
+
+import re
+import urllib
+
+import simplejson
+
+from httpexceptor import HTTP400, HTTP404
+
+from tiddlyweb.model.bag import Bag
+from tiddlyweb.model.tiddler import Tiddler
+from tiddlyweb.store import NoBagError, StoreError
+from tiddlyweb.web.util import get_route_value
+
+from .cache import ETAGS
+from .stats import deactivate
+
+
+TIDDLER_PATH = re.compile(r'^/bags/([^/]+)/tiddlers/[^/]+$')
+
+VALIDATION_HEADERS = ['etag', 'cache-control', 'vary', 'last-modified']
+
+
+def init(config):
+    if 'selector' in config:
+        config['selector'].add('/bags/{bag_name:segment}/changes',
+                GET=get_changes)
+    request_filters = config.get('server_request_filters')
+    if request_filters is not None:
+        for request_filter in [RequestTimings, ConditionalGet]:
+            if request_filter not in request_filters:
+                # innermost, after negotiation
+                request_filters.append(request_filter)
+
+
+class RequestTimings(object):
+    """
+    WSGI middleware ending the collection of the store's timings (see `stats`)
+    for the current thread once the request has been handled, so that work
+    done by the thread afterwards is not attributed to that request
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        try:
+            return self.application(environ, start_response)
+        finally:
+            deactivate(environ)
+
+
+class ConditionalGet(object):
+    """
+    WSGI middleware answering conditional GETs of tiddlers within bags based on
+    the store's cheap revision lookup (see `Store.tiddler_version`)
+
+    TiddlyWeb's ETags depend on the tiddler's contents as well as on the
+    requesting user, the negotiated representation and the bag's policy, so
+    ETags are memorized along with these request details; a request presenting
+    such an ETag in `If-None-Match` is answered with 304 if the tiddler's
+    revision and the bag's policy are still the same
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        storage = getattr(environ.get('tiddlyweb.store'), 'storage', None)
+        match = TIDDLER_PATH.match(_path(environ))
+        if (environ['REQUEST_METHOD'] != 'GET' or not match or
+                not hasattr(storage, 'tiddler_version')):
+            return self.application(environ, start_response)
+
+        request = _request_details(environ)
+        incoming_etag = environ.get('HTTP_IF_NONE_MATCH')
+        if incoming_etag:
+            entry = ETAGS.get((request, incoming_etag))
+            if entry and _versions(storage, entry['bag'], entry['title']) == \
+                    (entry['revision'], entry['policy']):
+                start_response('304 Not Modified', entry['headers'])
+                return []
+
+        bag_name = urllib.unquote(match.group(1)).decode('utf-8')
+        policy = _policy_version(storage, bag_name)
+
+        response = {}
+        def _start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+            return start_response(status, headers, exc_info)
+
+        output = self.application(environ, _start_response)
+        if response.get('status', '').startswith('200') and policy:
+            self._memorize(environ, storage, request, policy,
+                    response['headers'])
+        return output
+
+    def _memorize(self, environ, storage, request, policy, headers):
+        """
+        record the ETag of a successful response, provided the bag's policy has
+        not changed while processing the request
+        """
+        routing_args = environ.get('wsgiorg.routing_args', ((), {}))[1]
+        if 'revision' in routing_args or 'bag_name' not in routing_args:
+            return
+        headers = [(name, value) for name, value in headers
+                if name.lower() in VALIDATION_HEADERS]
+        etags = [value for name, value in headers if name.lower() == 'etag']
+        if not etags:
+            return
+
+        bag_name = get_route_value(environ, 'bag_name')
+        title = get_route_value(environ, 'tiddler_name')
+        if _policy_version(storage, bag_name) != policy:
+            return
+        # the revision served is encoded in the ETag: "bag/title/revision:..."
+        revision = etags[0].strip('"').split(':', 1)[0].rsplit('/', 1)[-1]
+        ETAGS.add((request, etags[0]), {
+            'bag': bag_name,
+            'title': title,
+            'revision': revision,
+            'policy': policy,
+            'headers': headers
+        })
+
+
+def get_changes(environ, start_response):
+    bag_name = get_route_value(environ, 'bag_name')
+    since = environ['tiddlyweb.query'].get('since', [None])[0]
+
+    store = environ['tiddlyweb.store']
+    try:
+        bag = store.get(Bag(bag_name))
+    except NoBagError, exc:
+        raise HTTP404('%s not found: %s' % (bag_name, exc))
+    bag.policy.allows(environ['tiddlyweb.usersign'], 'read')
+
+    if not hasattr(store.storage, 'tiddler_changes'): # different store
+        raise HTTP404('change feed not supported by store')
+    try:
+        changes = store.storage.tiddler_changes(bag.name, since)
+    except NoBagError, exc: # no commits yet
+        raise HTTP404('%s not found: %s' % (bag_name, exc))
+    except ValueError, exc:
+        raise HTTP400('invalid parameter "since": %s' % exc)
+
+    start_response('200 OK', [
+        ('Content-Type', 'application/json; charset=UTF-8'),
+        ('Cache-Control', 'no-cache')
+    ])
+    return [simplejson.dumps(changes)]
+
+
+def _path(environ):
+    path = environ.get('PATH_INFO', '')
+    prefix = environ.get('tiddlyweb.config', {}).get('server_prefix', '')
+    if prefix and path.startswith(prefix):
+        path = path[len(prefix):]
+    return path
+
+
+def _request_details(environ):
+    """
+    returns the aspects of a request which determine a tiddler's ETag, apart
+    from the tiddler itself
+    """
+    usersign = environ.get('tiddlyweb.usersign', {})
+    return (environ.get('PATH_INFO'), environ.get('QUERY_STRING'),
+            environ.get('HTTP_ACCEPT'), usersign.get('name'),
+            tuple(sorted(usersign.get('roles', []))))
+
+
+def _versions(storage, bag_name, title):
+    """
+    returns the tiddler's revision along with the bag's policy version, None if
+    unavailable
+    """
+    try:
+        revision, _ = storage.tiddler_version(Tiddler(title, bag_name))
+    except (StoreError, ValueError):
+        return None
+    return revision, _policy_version(storage, bag_name)
+
+
+def _policy_version(storage, bag_name):
+    try:
+        return storage.policy_version(bag_name)
+    except (StoreError, ValueError):
+        return None